@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import User, Student, Book, Transaction, TransactionItem, VerificationCode
+from .models import (User, Student, Book, BookCopy, Category, Hold, InventoryEvent, PosToken, Transaction, TransactionItem,
+                     ArchivedTransaction, ArchivedTransactionItem, VerificationCode, SlowQuery)
 
 
 class TransactionItemInline(admin.TabularInline):
@@ -29,9 +30,78 @@ class StudentAdmin(admin.ModelAdmin):
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['isbn', 'title', 'author', 'category', 'copies_available', 'copies_total']
+    list_display = ['isbn', 'title', 'author', 'category', 'get_availability', 'copies_total']
     list_filter = ['category']
     search_fields = ['isbn', 'title', 'author']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_availability()
+    
+    # copies_available alone misses the inventory events not yet folded into it.
+    def get_availability(self, obj):
+        return obj.availability
+    get_availability.short_description = 'Copies available'
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    list_display = ['barcode', 'book', 'status']
+    list_filter = ['status']
+    search_fields = ['barcode', 'book__title', 'book__isbn']
+    list_select_related = ['book']
+    raw_id_fields = ['book', 'current_item']
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ['book', 'student', 'status', 'copy', 'created_at', 'ready_at', 'notified_at']
+    list_filter = ['status']
+    search_fields = ['book__title', 'book__isbn', 'student__student_id', 'student__last_name']
+    list_select_related = ['book', 'student', 'copy']
+    
+    # Holds move between states with their copies; students cancel them from the dashboard.
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PosToken)
+class PosTokenAdmin(admin.ModelAdmin):
+    list_display = ['user', 'name', 'created_at']
+    list_select_related = ['user']
+    
+    # Tokens are issued with issue_pos_token, which shows the key once; delete one to revoke it.
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventoryEvent)
+class InventoryEventAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'book', 'copy', 'kind', 'delta', 'folded', 'created_by']
+    list_filter = ['kind', 'folded']
+    search_fields = ['book__title', 'book__isbn', 'copy__barcode']
+    list_select_related = ['book', 'copy', 'created_by']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['name', 'book_count', 'available_copies']
+    search_fields = ['name']
+    readonly_fields = ['book_count', 'available_copies']
 
 
 @admin.register(Transaction)
@@ -41,18 +111,50 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ['transaction_code', 'student__student_id']
     date_hierarchy = 'borrowed_date'
     inlines = [TransactionItemInline]
+    list_select_related = ['student']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('items')
     
     def get_book_count(self, obj):
-        return obj.items.count()
+        return len(obj.items.all())
     get_book_count.short_description = 'Books'
 
 
+class ArchivedTransactionItemInline(admin.TabularInline):
+    model = ArchivedTransactionItem
+    extra = 0
+    fields = ['book', 'copy', 'status', 'borrowed_date', 'return_date']
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ['transaction_code', 'student', 'borrowed_date', 'return_date', 'status', 'approval_status', 'archived_at']
+    list_filter = ['status', 'approval_status', 'borrowed_date']
+    search_fields = ['transaction_code', 'student__student_id']
+    date_hierarchy = 'borrowed_date'
+    inlines = [ArchivedTransactionItemInline]
+    list_select_related = ['student']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(TransactionItem)
 class TransactionItemAdmin(admin.ModelAdmin):
     list_display = ['transaction', 'book', 'status', 'borrowed_date', 'return_date']
     list_filter = ['status', 'borrowed_date']
     search_fields = ['transaction__transaction_code', 'book__title']
+    list_select_related = ['transaction__student', 'book']
     date_hierarchy = 'borrowed_date'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('transaction__items')
 
 
 @admin.register(VerificationCode)
@@ -60,3 +162,11 @@ class VerificationCodeAdmin(admin.ModelAdmin):
     list_display = ['student', 'code', 'created_at', 'expires_at', 'is_used']
     list_filter = ['is_used', 'created_at']
     search_fields = ['student__student_id', 'code']
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['view_name', 'table_name', 'duration_ms', 'created_at']
+    list_filter = ['table_name', 'view_name']
+    search_fields = ['normalized_sql', 'fingerprint']
+    readonly_fields = ['view_name', 'fingerprint', 'table_name', 'normalized_sql', 'duration_ms', 'explain', 'created_at']
@@ -0,0 +1,85 @@
+"""
+Circulation analytics.
+
+Reports read the CirculationDaily rollup (one row per day, book, category
+and course with borrow and return counts) rather than transaction items,
+so a range of years costs thousands of rows, not millions. Views keep the
+rollup current as loans are approved and returned; backfill() rebuilds it
+from live and archived items, e.g. after first deploying it.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import ArchivedTransactionItem, CirculationDaily, TransactionItem
+
+
+BATCH_SIZE = 2000
+# Longer ranges are charted per month instead of per day.
+DAILY_TREND_MAX_DAYS = 92
+
+
+def _item_counts(items, date_field, since):
+    if since:
+        items = items.filter(**{f'{date_field}__date__gte': since})
+    return (
+        items.annotate(day=TruncDate(date_field)).order_by()
+        .values_list('day', 'book_id', 'book__category', 'transaction__student__course')
+        .annotate(count=Count('id'))
+    )
+
+
+def backfill(since=None):
+    """Rebuild rollup rows from `since` (a date; all history if None); returns rows written."""
+    totals = defaultdict(lambda: [0, 0])
+    for model in (TransactionItem, ArchivedTransactionItem):
+        approved = model.objects.filter(transaction__approval_status='approved')
+        for day, book_id, category, course, count in _item_counts(approved, 'borrowed_date', since):
+            totals[day, book_id, category, course][0] += count
+        returned = approved.filter(status='returned', return_date__isnull=False)
+        for day, book_id, category, course, count in _item_counts(returned, 'return_date', since):
+            totals[day, book_id, category, course][1] += count
+
+    with transaction.atomic():
+        existing = CirculationDaily.objects.all()
+        if since:
+            existing = existing.filter(date__gte=since)
+        existing.delete()
+        CirculationDaily.objects.bulk_create([
+            CirculationDaily(date=day, book_id=book_id, category=category, course=course,
+                             borrows=borrows, returns=returns)
+            for (day, book_id, category, course), (borrows, returns) in totals.items()
+        ], batch_size=BATCH_SIZE)
+    return len(totals)
+
+
+def report(days, category=''):
+    """Trend, top books, categories and courses for the last `days` days."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = CirculationDaily.objects.filter(date__gte=since)
+    if category:
+        rows = rows.filter(category=category)
+
+    bucket = TruncMonth('date') if days > DAILY_TREND_MAX_DAYS else F('date')
+    trend = list(
+        rows.annotate(period=bucket).order_by('period').values('period')
+        .annotate(borrows=Sum('borrows'), returns=Sum('returns'))
+    )
+    peak = max([point['borrows'] for point in trend] + [1])
+    for point in trend:
+        point['percent'] = point['borrows'] * 100 // peak
+
+    return {
+        'since': since,
+        'monthly': days > DAILY_TREND_MAX_DAYS,
+        'trend': trend,
+        'totals': rows.aggregate(borrows=Sum('borrows'), returns=Sum('returns')),
+        'top_books': rows.order_by().values('book_id', 'book__title', 'book__author')
+                         .annotate(borrows=Sum('borrows')).order_by('-borrows', 'book__title')[:10],
+        'categories_report': rows.order_by().values('category').annotate(borrows=Sum('borrows')).order_by('-borrows')[:10],
+        'courses': rows.order_by().values('course').annotate(borrows=Sum('borrows')).order_by('-borrows')[:10],
+    }
@@ -0,0 +1,158 @@
+"""
+JSON API for POS barcode terminals.
+
+Each call is authenticated with an `Authorization: Token <key>` header
+(keys come from issue_pos_token) rather than a login session, so a
+terminal sends no cookies or CSRF token and the server keeps no cart: the
+terminal holds its own cart and submits it whole to checkout. Responses
+are built from the few columns they need and no template is rendered.
+
+    GET  api/pos/students/<student_id>/   an approved student
+    GET  api/pos/books/<barcode or ISBN>/ a book, its availability and the scanned copy
+    POST api/pos/checkouts/               {"student_id", "codes": [...], "idempotency_key"}
+    POST api/pos/returns/                 {"barcodes": [...]}
+
+Checkout and return go through library/circulation.py, as the POS pages do.
+"""
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .circulation import checkout as lend_copies, return_items, scan, submitted_checkout
+from .isbn import canonical_isbn
+from .models import Book, BookCopy, PosToken, Student, Transaction, TransactionItem
+
+
+STUDENT_FIELDS = ('student_id', 'first_name', 'last_name', 'course', 'year', 'section')
+
+
+def pos_token_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        user = PosToken.authenticate(key) if scheme == 'Token' and key else None
+        if user is None:
+            return JsonResponse({'error': 'Invalid or missing API token'}, status=401)
+        request.user = user
+        return view(request, *args, **kwargs)
+    # Token-authenticated calls carry no cookies for CSRF to protect.
+    return csrf_exempt(wrapper)
+
+
+def _payload(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _codes(value):
+    return [str(code).strip() for code in value if str(code).strip()] if isinstance(value, list) else []
+
+
+@require_GET
+@pos_token_required
+def student(request, student_id):
+    found = Student.objects.filter(student_id=student_id, is_approved=True).values(*STUDENT_FIELDS).first()
+    if found is None:
+        return JsonResponse({'error': 'Student ID not found or not approved by admin'}, status=404)
+    return JsonResponse({'student': found})
+
+
+@require_GET
+@pos_token_required
+def book(request, code):
+    copy = BookCopy.objects.filter(barcode=code).values('barcode', 'status', 'book_id').first()
+    lookup = {'id': copy['book_id']} if copy else {'isbn13': canonical_isbn(code)}
+    found = (
+        Book.objects.with_availability().filter(**lookup)
+        .values('id', 'isbn', 'title', 'author', 'copies_total', 'copies_available', 'unfolded_delta', 'next_available_at')
+        .first()
+    )
+    if found is None:
+        return JsonResponse({'error': 'Book with this ISBN not found'}, status=404)
+    found['available'] = found.pop('copies_available') + found.pop('unfolded_delta')
+    return JsonResponse({'book': found, 'copy': copy and {'barcode': copy['barcode'], 'status': copy['status']}})
+
+
+def _transaction_json(loan):
+    return {
+        'code': loan.transaction_code,
+        'due_date': loan.due_date,
+        'approval_status': loan.approval_status,
+        'items': [
+            {'id': item_id, 'barcode': barcode, 'title': title}
+            for item_id, barcode, title in loan.items.values_list('id', 'copy__barcode', 'book__title')
+        ],
+    }
+
+
+@require_POST
+@pos_token_required
+def checkout(request):
+    data = _payload(request)
+    if data is None:
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    # A retried call with the same key gets the transaction the first one created.
+    idempotency_key = str(data.get('idempotency_key') or '')[:64] or None
+    original = submitted_checkout(idempotency_key, request.user)
+    if original:
+        return JsonResponse({'transaction': _transaction_json(original), 'created': False})
+
+    codes = _codes(data.get('codes'))
+    found = Student.objects.filter(student_id=str(data.get('student_id') or ''), is_approved=True).first()
+    if found is None:
+        return JsonResponse({'error': 'Student ID not found or not approved by admin'}, status=404)
+    if not codes:
+        return JsonResponse({'error': 'No codes to check out'}, status=400)
+
+    results = scan(codes, found.student_id)
+    scanned = [
+        {'code': result['code'], 'status': result['status'],
+         'barcode': result['copy'].barcode if result['status'] == 'added' else None}
+        for result in results
+    ]
+    copy_ids = [result['copy'].id for result in results if result['status'] == 'added']
+    if not copy_ids:
+        return JsonResponse({'error': 'None of the scanned books are available', 'scanned': scanned}, status=409)
+
+    loan, created = lend_copies(found, copy_ids, request.user, idempotency_key)
+    return JsonResponse({'transaction': _transaction_json(loan), 'created': created, 'scanned': scanned},
+                        status=201 if created else 200)
+
+
+@require_POST
+@pos_token_required
+def returns(request):
+    data = _payload(request)
+    if data is None:
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    barcodes = _codes(data.get('barcodes'))
+    if not barcodes:
+        return JsonResponse({'error': 'No barcodes to return'}, status=400)
+
+    items = TransactionItem.objects.filter(
+        current_copy__barcode__in=barcodes, status='borrowed', transaction__approval_status='approved'
+    ).values_list('id', 'current_copy__barcode', 'transaction_id')
+    barcode_of, loans = {}, {}
+    for item_id, barcode, transaction_id in items:
+        barcode_of[item_id] = barcode
+        loans.setdefault(transaction_id, []).append(item_id)
+
+    returned = []
+    for loan in Transaction.objects.filter(id__in=list(loans)).select_related('student'):
+        for item in return_items(loan, loans[loan.id], request.user)[0]:
+            returned.append({
+                'barcode': barcode_of[item.id],
+                'title': item.book.title,
+                'transaction': loan.transaction_code,
+                # The copy goes on the hold shelf for this student instead of back on the shelf.
+                'hold_for': item.holds[0].student.student_id if item.holds else None,
+            })
+    on_loan = set(barcode_of.values())
+    not_on_loan = [barcode for barcode in barcodes if barcode not in on_loan]
+    return JsonResponse({'returned': returned, 'not_on_loan': not_on_loan})
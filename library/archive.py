@@ -0,0 +1,67 @@
+"""
+Transaction archive.
+
+Returned and rejected transactions are moved, with their items, from the
+live Transaction/TransactionItem tables into ArchivedTransaction and
+ArchivedTransactionItem, so the tables behind the POS lookups and the
+dashboards only hold open and recently closed loans. Archived rows keep
+their ids and stay queryable for student history and reports.
+
+Archiving runs in batches from the archive_transactions command; each
+batch is copied and deleted in one database transaction.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedTransaction, ArchivedTransactionItem, Transaction, TransactionItem
+
+
+TRANSACTION_FIELDS = ('id', 'transaction_code', 'student_id', 'borrowed_date', 'due_date', 'return_date',
+                      'status', 'approval_status', 'approved_by_id', 'approved_at')
+ITEM_FIELDS = ('id', 'transaction_id', 'book_id', 'copy_id', 'borrowed_date', 'return_date', 'status')
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'TRANSACTION_ARCHIVE_AFTER_DAYS', 30)
+    return timezone.now() - timedelta(days=days)
+
+
+def closed_transactions(cutoff):
+    return Transaction.objects.filter(
+        Q(status='returned', return_date__lt=cutoff) | Q(approval_status='rejected', approved_at__lt=cutoff)
+    )
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Move up to `batch_size` transactions closed before `cutoff`; returns how many were moved."""
+    with transaction.atomic():
+        ids = list(closed_transactions(cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        ArchivedTransaction.objects.bulk_create([
+            ArchivedTransaction(**row) for row in Transaction.objects.filter(id__in=ids).values(*TRANSACTION_FIELDS)
+        ])
+        ArchivedTransactionItem.objects.bulk_create([
+            ArchivedTransactionItem(**row)
+            for row in TransactionItem.objects.filter(transaction_id__in=ids).values(*ITEM_FIELDS)
+        ])
+        Transaction.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def student_history(student, limit=10):
+    """The student's most recent approved transactions, live and archived, newest first."""
+    live = (
+        Transaction.objects.filter(student=student, approval_status='approved')
+        .prefetch_related('items__book').order_by('-borrowed_date')[:limit]
+    )
+    archived = (
+        ArchivedTransaction.objects.filter(student=student, approval_status='approved')
+        .prefetch_related('items__book').order_by('-borrowed_date')[:limit]
+    )
+    return sorted([*live, *archived], key=lambda entry: entry.borrowed_date, reverse=True)[:limit]
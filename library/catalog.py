@@ -0,0 +1,164 @@
+"""
+Catalog versioning and result caching.
+
+The book list pages only change when a Book row does (or the system name or
+logo in the page header), so their ETag is derived from one aggregate query
+rather than from the rendered page. A browser or POS terminal revalidating
+an unchanged page gets a 304 without the view querying or rendering
+anything.
+
+For the student catalog grid, the IDs and total count behind each
+(search, category, page) are cached; the category dropdown comes from the
+small Category table. Cached entries are keyed on a generation per category
+(plus one for unfiltered pages) that is replaced whenever a book is added,
+removed or changes a field that affects filtering or ordering, including
+when refresh_popularity rescores it. Borrowing and returning only change
+copy counts, which are always read fresh, so they never invalidate anything.
+"""
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Case, Count, IntegerField, Max, Q, Value, When
+from django.views.decorators.http import condition
+
+from .isbn import canonical_isbn
+from .metrics import registry
+from .models import Book, Category, InventoryEvent, SystemSettings
+
+
+PER_PAGE = 24
+ALL_CATEGORIES = '*'
+# Orderings offered on the student catalog; searches default to relevance.
+SORTS = {'title': 'Title', 'popular': 'Most popular'}
+# Fields whose change can move a book between, or within, cached pages.
+INDEXED_FIELDS = ('title', 'author', 'isbn', 'category', 'copies_total')
+
+
+def catalog_version(request):
+    """(last change, book count, last inventory event) for the catalog, computed once per request."""
+    if not hasattr(request, '_catalog_version'):
+        version = Book.objects.aggregate(last_updated=Max('updated_at'), count=Count('id'))
+        # Borrowing and returning append inventory events rather than touching books.
+        event_id, event_at = InventoryEvent.objects.order_by('-id').values_list('id', 'created_at').first() or (0, None)
+        system_settings = SystemSettings.get_settings()
+        # Reused by the system_settings context processor.
+        request._system_settings = system_settings
+        last_modified = max(filter(None, [version['last_updated'], event_at, system_settings.updated_at]))
+        request._catalog_version = (last_modified, version['count'], event_id)
+    return request._catalog_version
+
+
+def _cacheable(request, user_types):
+    # Pending flash messages are shown once, so that render must not be skipped.
+    return request.user.user_type in user_types and not len(get_messages(request))
+
+
+def catalog_etag(*user_types):
+    def etag(request, *args, **kwargs):
+        if not _cacheable(request, user_types):
+            return None
+        last_modified, count, event_id = catalog_version(request)
+        query = sorted(request.GET.lists())
+        key = f'{request.user.pk}:{last_modified.isoformat()}:{count}:{event_id}:{query}'
+        return hashlib.sha1(key.encode()).hexdigest()
+    return etag
+
+
+def catalog_last_modified(*user_types):
+    def last_modified(request, *args, **kwargs):
+        if not _cacheable(request, user_types):
+            return None
+        return catalog_version(request)[0]
+    return last_modified
+
+
+def catalog_condition(*user_types):
+    """`condition` for a catalog page viewed by `user_types`; other users skip it."""
+    return condition(etag_func=catalog_etag(*user_types), last_modified_func=catalog_last_modified(*user_types))
+
+
+def _generation_key(scope):
+    return 'catalog:generation:' + hashlib.sha1(scope.encode()).hexdigest()
+
+
+def generations(*scopes):
+    keys = {scope: _generation_key(scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    result = {}
+    for scope, key in keys.items():
+        if key not in found:
+            # Never fall back to a fixed default: entries written under it
+            # before an eviction could otherwise come back to life.
+            cache.add(key, uuid4().hex, None)
+            found[key] = cache.get(key)
+        result[scope] = found[key]
+    return result
+
+
+def invalidate(*categories):
+    """Retire cached pages for `categories` and for the unfiltered catalog."""
+    scopes = {ALL_CATEGORIES, *filter(None, categories)}
+    cache.set_many({_generation_key(scope): uuid4().hex for scope in scopes}, None)
+
+
+def indexed_values(book):
+    # Read through __dict__ so deferred fields are not fetched just for this.
+    return tuple(book.__dict__.get(name) for name in INDEXED_FIELDS)
+
+
+def catalog_books(search, category, sort=''):
+    books = Book.objects.with_availability().filter(copies_total__gt=0)
+    if search:
+        isbn13 = canonical_isbn(search)
+        books = books.filter(
+            Q(title__icontains=search) | Q(author__icontains=search) | Q(isbn__icontains=search) |
+            Q(isbn13=isbn13)
+        )
+    if category:
+        books = books.filter(category=category)
+    if sort == 'popular':
+        return books.order_by('-popularity', 'title')
+    if search and sort != 'title':
+        # Rank how well the text matches, then break ties by popularity.
+        relevance = Case(
+            When(isbn13=isbn13, then=Value(3)),
+            When(title__iexact=search, then=Value(2)),
+            When(title__istartswith=search, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return books.annotate(relevance=relevance).order_by('-relevance', '-popularity', 'title')
+    return books.order_by('title')
+
+
+def catalog_page(search, category, page_number, sort=''):
+    """Paginated student catalog in `sort` order, served from the result cache when possible.
+
+    Returns (page, categories) for the category filter dropdown.
+    """
+    scope = category or ALL_CATEGORIES
+    generation = generations(scope)[scope]
+    page_key = 'catalog:page:' + hashlib.sha1(
+        f'{generation}:{search}:{category}:{sort}:{page_number}'.encode()
+    ).hexdigest()
+    entry = cache.get(page_key)
+    categories = list(Category.objects.filter(book_count__gt=0).values_list('name', flat=True))
+    timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    paginator = Paginator(catalog_books(search, category, sort), PER_PAGE)
+    if entry is None:
+        registry.increment('catalog_cache_misses')
+        page = paginator.get_page(page_number)
+        entry = {'ids': [book.id for book in page], 'count': paginator.count, 'number': page.number}
+        cache.set(page_key, entry, timeout)
+        return page, categories
+
+    registry.increment('catalog_cache_hits')
+    paginator.count = entry['count']
+    books = Book.objects.with_availability().in_bulk(entry['ids'])
+    page = Page([books[book_id] for book_id in entry['ids'] if book_id in books], entry['number'], paginator)
+    return page, categories
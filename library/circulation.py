@@ -0,0 +1,154 @@
+"""
+POS circulation: resolving scanned codes, checking copies out and taking
+them back.
+
+Shared by the POS pages and the JSON POS API (library/api.py) so both
+keep copies, holds, the inventory ledger and the circulation rollup in
+step the same way.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Book, BookCopy, CirculationDaily, Hold, InventoryEvent, Transaction, TransactionItem
+
+
+LOAN_DAYS = 7
+
+
+def scan(codes, student_id, in_cart=()):
+    """Resolve scanned copy barcodes and ISBNs to the copies they would lend the student.
+
+    A barcode names the exact copy; an ISBN takes the student's copy on
+    the hold shelf if there is one, else any copy on the shelf. Each
+    lookup is one query for the whole batch, and a code scanned twice
+    takes a second copy. Returns one dict per code, in order, with
+    'code', 'status' ('added', 'unavailable' or 'not_found'), 'book',
+    'copy' and, when no copy of the book was free, 'expected_back'.
+    """
+    in_cart = set(in_cart)
+    # Copies on the hold shelf for this student.
+    held = set(Hold.objects.filter(
+        student__student_id=student_id, status='ready'
+    ).values_list('copy_id', flat=True))
+
+    by_barcode = BookCopy.objects.select_related('book').in_bulk(codes, field_name='barcode')
+    by_isbn = Book.objects.in_bulk_by_isbn([code for code in codes if code not in by_barcode])
+    shelf = {}
+    if by_isbn:
+        candidates = BookCopy.objects.filter(
+            Q(status='available') | Q(id__in=held), book__in={book.id for book in by_isbn.values()}
+        ).order_by('number')
+        for copy in candidates:
+            shelf.setdefault(copy.book_id, []).append(copy)
+        for copies in shelf.values():
+            copies.sort(key=lambda copy: copy.id not in held)
+
+    results = []
+    for code in codes:
+        copy = by_barcode.get(code)
+        if copy is not None:
+            book = copy.book
+        elif code in by_isbn:
+            book = by_isbn[code]
+            copy = next((copy for copy in shelf.get(book.id, []) if copy.id not in in_cart), None)
+        else:
+            results.append({'code': code, 'status': 'not_found', 'book': None, 'copy': None})
+            continue
+
+        if copy is None or (copy.status != 'available' and copy.id not in held) or copy.id in in_cart:
+            results.append({'code': code, 'status': 'unavailable', 'book': book, 'copy': copy,
+                            'expected_back': book.next_available_at if copy is None else None})
+            continue
+        in_cart.add(copy.id)
+        results.append({'code': code, 'status': 'added', 'book': book, 'copy': copy})
+    return results
+
+
+def submitted_checkout(idempotency_key, user):
+    """The transaction `user` already created with `idempotency_key`, if any."""
+    if not idempotency_key:
+        return None
+    return Transaction.objects.filter(
+        idempotency_key=idempotency_key, created_by=user
+    ).select_related('student').first()
+
+
+def checkout(student, copy_ids, user, idempotency_key=None):
+    """Lend these copies to `student` in a new transaction pending approval.
+
+    Copies are held for the student until the loan is approved or
+    rejected; one taken by another terminal since it was scanned is
+    skipped. A repeated `idempotency_key` returns the transaction the
+    first submission created. Returns (transaction, created).
+    """
+    original = submitted_checkout(idempotency_key, user)
+    if original:
+        return original, False
+    due_date = timezone.now() + timedelta(days=LOAN_DAYS)
+    try:
+        with transaction.atomic():
+            loan = Transaction.objects.create(
+                transaction_code=Transaction.generate_transaction_code(),
+                student=student,
+                due_date=due_date,
+                created_by=user,
+                idempotency_key=idempotency_key or None
+            )
+            ready_holds = Hold.objects.select_for_update().filter(student=student, status='ready', copy_id__in=copy_ids)
+            collected = {hold.copy_id: hold.id for hold in ready_holds}
+            copies = BookCopy.objects.select_for_update().filter(
+                Q(status='available') | Q(status='held', id__in=list(collected)), id__in=copy_ids
+            )
+            lent, shelved = [], []
+            for copy in copies.select_related('book').order_by('id'):
+                copy.current_item = TransactionItem.objects.create(transaction=loan, book=copy.book, copy=copy)
+                # Copies from the hold shelf were never counted as on the shelf.
+                if copy.status == 'available':
+                    shelved.append(copy)
+                copy.status = 'pending'
+                copy.save(update_fields=['status', 'current_item'])
+                lent.append(copy)
+            InventoryEvent.record(shelved, 'borrow', user)
+            Hold.objects.filter(id__in=[collected[copy.id] for copy in lent if copy.id in collected]).update(status='collected')
+            Book.lent({copy.book_id for copy in lent}, due_date)
+    except IntegrityError:
+        # A concurrent submission of the same key committed first.
+        original = submitted_checkout(idempotency_key, user)
+        if original is None:
+            raise
+        return original, False
+    return loan, True
+
+
+def return_items(loan, item_ids, user):
+    """Take back the borrowed items of `loan` whose ids are in `item_ids`.
+
+    Each returned item's `holds` lists the holds its copy was set aside
+    for. Returns (returned items, items still borrowed, whether the whole
+    transaction is now returned).
+    """
+    item_ids = {str(item_id) for item_id in item_ids}
+    returned, unreturned = [], []
+    # One commit for the whole return rather than several per item.
+    with transaction.atomic():
+        for item in loan.items.filter(status='borrowed').select_related('book'):
+            if str(item.id) not in item_ids:
+                unreturned.append(item)
+                continue
+            item.status = 'returned'
+            item.return_date = timezone.now()
+            item.save()
+            # A copy due to the next student in the queue goes on the hold shelf.
+            item.holds = BookCopy.release(item, user)
+            CirculationDaily.add(item.return_date, item.book, loan.student.course, returns=1)
+            returned.append(item)
+
+        all_returned = not unreturned and not loan.items.filter(status='borrowed').exists()
+        if all_returned:
+            loan.status = 'returned'
+            loan.return_date = timezone.now()
+            loan.save()
+    return returned, unreturned, all_returned
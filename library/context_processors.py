@@ -4,7 +4,7 @@ def system_settings(request):
     """
     Make system settings available to all templates
     """
-    settings = SystemSettings.get_settings()
+    settings = getattr(request, '_system_settings', None) or SystemSettings.get_settings()
     return {
         'system_settings': settings
     }
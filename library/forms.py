@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from .models import Student, Book, User, Librarian, SystemSettings
+from .isbn import canonical_isbn
+from .uploads import validate_image_upload
 import csv
 from io import TextIOWrapper
 
@@ -67,6 +69,9 @@ class StudentRegistrationForm(forms.ModelForm):
             })
         )
     
+    def clean_profile_photo(self):
+        return validate_image_upload(self.cleaned_data.get('profile_photo'))
+    
     def clean(self):
         cleaned_data = super().clean()
         password = cleaned_data.get('password')
@@ -119,6 +124,16 @@ class BookForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg', 'rows': 4}),
             'book_cover': forms.FileInput(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg'}),
         }
+    
+    def clean_isbn(self):
+        isbn = self.cleaned_data['isbn'].strip()
+        duplicates = Book.objects.filter(isbn13=canonical_isbn(isbn)).exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise forms.ValidationError(f'A book with this ISBN already exists: {duplicates.first().title}')
+        return isbn
+    
+    def clean_book_cover(self):
+        return validate_image_upload(self.cleaned_data.get('book_cover'))
 
 
 class POSUserForm(forms.ModelForm):
@@ -202,6 +217,9 @@ class LibrarianForm(forms.ModelForm):
             'email': forms.EmailInput(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg'}),
             'profile_photo': forms.FileInput(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg'}),
         }
+    
+    def clean_profile_photo(self):
+        return validate_image_upload(self.cleaned_data.get('profile_photo'))
 
 
 class SystemSettingsForm(forms.ModelForm):
@@ -212,3 +230,6 @@ class SystemSettingsForm(forms.ModelForm):
             'system_name': forms.TextInput(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg'}),
             'system_logo': forms.FileInput(attrs={'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg'}),
         }
+    
+    def clean_system_logo(self):
+        return validate_image_upload(self.cleaned_data.get('system_logo'))
@@ -0,0 +1,36 @@
+"""
+ISBN normalization.
+
+Scanners emit bare ISBN-13, operators type hyphenated forms and older
+stock carries ISBN-10, so every book stores a canonical ISBN-13 next to
+the ISBN as entered and all lookups go through canonical_isbn().
+"""
+import re
+
+
+_SEPARATORS_RE = re.compile(r'[\s\-‐‑–]')
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def _is_valid_isbn10(value):
+    if not re.fullmatch(r'\d{9}[\dX]', value):
+        return False
+    total = sum((10 - index) * (10 if char == 'X' else int(char)) for index, char in enumerate(value))
+    return total % 11 == 0
+
+
+def canonical_isbn(value):
+    """Return the ISBN-13 for `value`, or its compacted form if it isn't a valid ISBN.
+
+    Falling back to the compacted string keeps non-standard local codes
+    unique and findable instead of rejecting them.
+    """
+    compact = _SEPARATORS_RE.sub('', value or '').upper()
+    if len(compact) == 10 and _is_valid_isbn10(compact):
+        first12 = '978' + compact[:9]
+        return first12 + _isbn13_check_digit(first12)
+    return compact or None
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from library.archive import archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move returned and rejected transactions into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive transactions closed more than this many days ago '
+                                 '(default: TRANSACTION_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Transactions moved per database transaction')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        total = 0
+        while True:
+            moved = archive_batch(cutoff, options['batch_size'])
+            total += moved
+            if moved:
+                self.stdout.write(f'Archived {total} transaction(s)...')
+            if moved < options['batch_size']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} transaction(s) closed before {cutoff:%Y-%m-%d %H:%M}'))
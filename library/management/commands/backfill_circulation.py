@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from library.analytics import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the CirculationDaily rollup from live and archived transaction items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, default=None,
+                            help='Only rebuild days from this date (YYYY-MM-DD); default is all history')
+
+    def handle(self, *args, **options):
+        rows = backfill(options['since'])
+        scope = f'since {options["since"]}' if options['since'] else 'for all history'
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily circulation row(s) {scope}'))
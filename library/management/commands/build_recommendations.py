@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from library.recommendations import rebuild, update
+
+
+class Command(BaseCommand):
+    help = 'Compute "also borrowed" book recommendations from co-borrowing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every book instead of only those affected by new loans')
+
+    def handle(self, *args, **options):
+        books, rows = rebuild() if options['full'] else update()
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} recommendation(s) for {books} book(s)'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from library.models import InventoryEvent
+
+
+class Command(BaseCommand):
+    help = 'Fold pending inventory events into each book\'s copies_available snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Books folded per transaction')
+
+    def handle(self, *args, **options):
+        book_ids = list(InventoryEvent.objects.filter(folded=False).order_by('book').values_list('book', flat=True).distinct())
+        folded = 0
+        for start in range(0, len(book_ids), options['batch_size']):
+            count, _ = InventoryEvent.fold(book_ids[start:start + options['batch_size']])
+            folded += count
+
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} event(s) into {len(book_ids)} book(s)'))
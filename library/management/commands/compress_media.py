@@ -0,0 +1,41 @@
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from library.media import COMPRESSIBLE_TYPES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = 'Write .gz (and .br if brotli is installed) copies of compressible media files for serve_media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-saving', type=float, default=0.05,
+                            help='Skip a variant that is not at least this fraction smaller')
+
+    def handle(self, *args, **options):
+        written = 0
+        for directory, _, filenames in os.walk(settings.MEDIA_ROOT):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                content_type = mimetypes.guess_type(path)[0] or ''
+                if not content_type.startswith(COMPRESSIBLE_TYPES):
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    variants.append(('.br', brotli.compress(data)))
+                for suffix, compressed in variants:
+                    if len(compressed) <= len(data) * (1 - options['min_saving']):
+                        with open(path + suffix, 'wb') as f:
+                            f.write(compressed)
+                        written += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} precompressed file(s)'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from library.models import Book, Student, Librarian, SystemSettings
+from library.storage import is_content_addressed
+from library.uploads import auto_now_values
+
+
+class Command(BaseCommand):
+    help = 'Move uploads saved before content-addressed storage to hashed names, merging duplicates'
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        targets = set()
+        for model, field_name in ((Book, 'book_cover'), (Student, 'profile_photo'),
+                                  (Librarian, 'profile_photo'), (SystemSettings, 'system_logo')):
+            storage = model._meta.get_field(field_name).storage
+            names = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list(field_name, flat=True).distinct()
+            )
+            for name in list(names):
+                if is_content_addressed(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f'Missing file {name}'))
+                    continue
+
+                with storage.open(name, 'rb') as source:
+                    new_name = storage.save(name, source)
+                rows = model.objects.filter(**{field_name: name}).update(**{field_name: new_name}, **auto_now_values(model))
+                storage.delete(name)
+                moved += 1
+                targets.add(new_name)
+                self.stdout.write(f'{name} -> {new_name} ({rows} row(s))')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} file(s) to {len(targets)} content-addressed file(s), '
+            f'{missing} missing'
+        ))
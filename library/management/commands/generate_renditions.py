@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from library import renditions
+from library.models import Book, Student, Librarian, SystemSettings
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnail renditions for every uploaded cover, photo and logo'
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for model, field in ((Book, 'book_cover'), (Student, 'profile_photo'),
+                             (Librarian, 'profile_photo'), (SystemSettings, 'system_logo')):
+            uploads = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only('id', field)
+            for obj in uploads.iterator():
+                image = getattr(obj, field)
+                if renditions.ensure(image):
+                    generated += 1
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Skipped {image.name}: not a readable image'))
+
+        self.stdout.write(self.style.SUCCESS(f'Renditions ready for {generated} image(s), {failed} skipped'))
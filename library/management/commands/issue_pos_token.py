@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from library.models import PosToken, User
+
+
+class Command(BaseCommand):
+    help = 'Issue an API token for a POS account to use with the JSON POS API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='POS account the terminal acts as')
+        parser.add_argument('--name', default='', help='Label for the terminal, e.g. "Front desk 2"')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username'], user_type='pos').first()
+        if user is None:
+            raise CommandError(f'No POS account named "{options["username"]}"')
+        key = PosToken.issue(user, options['name'])
+        self.stdout.write(self.style.SUCCESS(f'Token for {user.username}: {key}'))
+        self.stdout.write('Store it now; it cannot be shown again. Send it as "Authorization: Token <key>".')
@@ -0,0 +1,256 @@
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, Q
+from library.models import User, Student, Book, Transaction
+
+
+PREFIX = 'loadtest'
+TRANSACTION_CODE_RE = re.compile(r'Transaction Code: <span[^>]*>([A-Z0-9]+)</span>')
+RETURN_ITEM_RE = re.compile(r'name="selected_books" value="(\d+)"')
+
+
+class Terminal:
+    """One simulated POS terminal: its own cookie session, timed against the shared results."""
+
+    def __init__(self, base_url, results):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, step, path, data=None):
+        body = urlencode(data, doseq=True).encode() if data is not None else None
+        req = Request(self.base_url + path, data=body)
+        if body is not None:
+            req.add_header('X-CSRFToken', self.csrf_token())
+            req.add_header('Referer', self.base_url + path)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                html = response.read().decode('utf-8', 'replace')
+                status = response.status
+        except HTTPError as e:
+            html, status = '', e.code
+        except URLError as e:
+            html, status = str(e.reason), 0
+        self.results.record(step, time.perf_counter() - start, ok=200 <= status < 400)
+        return html
+
+    def login(self, username, password):
+        self.request('login_page', '/')
+        self.request('login', '/', {'username': username, 'password': password})
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.cycles = 0
+        self.unavailable = 0
+        self.empty_carts = 0
+
+    def record(self, step, seconds, ok=True):
+        with self.lock:
+            self.latencies.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+    def count(self, attribute):
+        with self.lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent POS terminals doing borrow/approve/return cycles against a running server, '
+            'then check book inventory for oversell and lost updates. Run it with the same database '
+            'as the server under test, given by DATABASE_URL or --database; it will not fall back to the '
+            'configured default.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--terminals', type=int, default=8, help='Concurrent POS terminals')
+        parser.add_argument('--cycles', type=int, default=20, help='Borrow/return cycles per terminal')
+        parser.add_argument('--books-per-checkout', type=int, default=2)
+        parser.add_argument('--books', type=int, default=5, help='Size of the (deliberately small) book pool')
+        parser.add_argument('--copies', type=int, default=3, help='Copies of each load-test book')
+        parser.add_argument('--database', choices=list(connections), help='Database alias to seed and check')
+        parser.add_argument('--cleanup', action='store_true', help='Delete load-test data and exit')
+
+    def handle(self, *args, **options):
+        if not os.environ.get('DATABASE_URL') and not options['database']:
+            raise CommandError('Set DATABASE_URL or pass --database: the load test seeds and deletes '
+                               'accounts and books, so it does not run against the default database implicitly.')
+        if options['database'] and options['database'] != DEFAULT_DB_ALIAS:
+            # Model hooks write through the default connection, so point it at the chosen database.
+            connection.close()
+            connections.settings[DEFAULT_DB_ALIAS] = connections.settings[options['database']]
+            del connections[DEFAULT_DB_ALIAS]
+
+        if options['cleanup']:
+            self.cleanup()
+            self.stdout.write(self.style.SUCCESS('Load-test data removed'))
+            return
+
+        # Seeded accounts can log in to the server under test, so they get a
+        # password nobody knows and are deleted when the run ends.
+        options['password'] = secrets.token_urlsafe(16)
+        self.cleanup()
+        try:
+            self.run(options)
+        finally:
+            self.cleanup()
+
+    def run(self, options):
+        books = self.seed(options)
+        results = Results()
+        isbns = [book.isbn for book in books]
+
+        threads = [
+            threading.Thread(target=self.run_terminal, args=(number, options, isbns, results))
+            for number in range(options['terminals'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.report(results, elapsed)
+        self.check_inventory(books)
+
+    def seed(self, options):
+        for number in range(options['terminals']):
+            User.objects.create_user(f'{PREFIX}_pos_{number}', options['password'], user_type='pos')
+            User.objects.create_user(f'{PREFIX}_admin_{number}', options['password'], user_type='admin')
+            Student.objects.create(
+                student_id=f'{PREFIX}-{number}', last_name='Load', first_name=f'Terminal {number}',
+                course='LOAD', year='1', section='A', is_approved=True
+            )
+        # Created one by one so the save hooks fill isbn13 and category counters.
+        return [
+            Book.objects.create(isbn=f'{PREFIX}{number:05d}', title=f'Load Test Book {number}', author='Load Test',
+                                category='Load Test', copies_total=options['copies'], copies_available=options['copies'])
+            for number in range(options['books'])
+        ]
+
+    def cleanup(self):
+        Transaction.objects.filter(student__student_id__startswith=f'{PREFIX}-').delete()
+        Student.objects.filter(student_id__startswith=f'{PREFIX}-').delete()
+        Book.objects.filter(isbn__startswith=PREFIX).delete()
+        User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+
+    def run_terminal(self, number, options, isbns, results):
+        pos = Terminal(options['base_url'], results)
+        approver = Terminal(options['base_url'], results)
+        pos.login(f'{PREFIX}_pos_{number}', options['password'])
+        approver.login(f'{PREFIX}_admin_{number}', options['password'])
+        rng = random.Random(number)
+        try:
+            for _ in range(options['cycles']):
+                self.run_cycle(pos, approver, f'{PREFIX}-{number}', rng.sample(isbns, options['books_per_checkout']), results)
+        finally:
+            connection.close()
+
+    def run_cycle(self, pos, approver, student_id, isbns, results):
+        pos.request('scan_student', '/pos/borrow/', {'student_id': student_id})
+        # The whole cart is scanned in one request, as a scanner burst would be.
+        html = pos.request('scan_books', '/pos/borrow/', {'isbn': '\n'.join(isbns)})
+        unavailable = html.count('Book is not available')
+        for _ in range(unavailable):
+            results.count('unavailable')
+        added = len(isbns) - unavailable
+        if not added:
+            results.count('empty_carts')
+            return
+
+        html = pos.request('confirm', '/pos/borrow/', {'confirm_borrow': ''})
+        match = TRANSACTION_CODE_RE.search(html)
+        if not match:
+            results.record('confirm_parse', 0, ok=False)
+            return
+        code = match.group(1)
+
+        transaction_id = Transaction.objects.filter(transaction_code=code).values_list('id', flat=True).first()
+        if transaction_id is None:
+            results.record('approve_lookup', 0, ok=False)
+            return
+        approver.request('approve', f'/admin/transactions/approve/{transaction_id}/', {})
+
+        html = pos.request('lookup_return', '/pos/return/', {'transaction_code': code})
+        item_ids = RETURN_ITEM_RE.findall(html)
+        if item_ids:
+            pos.request('return', '/pos/return/', {
+                'return_books': '',
+                'transaction_code_value': code,
+                'selected_books': item_ids,
+            })
+        results.count('cycles')
+
+    def report(self, results, elapsed):
+        total_requests = sum(len(values) for values in results.latencies.values())
+        self.stdout.write(f'\nCompleted {results.cycles} cycles / {total_requests} requests in {elapsed:.1f}s')
+        self.stdout.write(f'Throughput: {results.cycles / elapsed:.2f} cycles/s, {total_requests / elapsed:.1f} requests/s')
+        self.stdout.write(f'"Book is not available" responses: {results.unavailable} '
+                          f'({results.empty_carts} cycles had nothing to check out)\n')
+        self.stdout.write(f'{"step":<16}{"count":>7}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+        for step, values in results.latencies.items():
+            values = sorted(values)
+            self.stdout.write(
+                f'{step:<16}{len(values):>7}{results.errors.get(step, 0):>8}'
+                f'{percentile(values, 0.5) * 1000:>9.1f}{percentile(values, 0.95) * 1000:>9.1f}'
+                f'{percentile(values, 0.99) * 1000:>9.1f}{values[-1] * 1000:>9.1f}'
+            )
+
+    def check_inventory(self, books):
+        """Compare each book's availability with what its open (held or approved) items say it should be."""
+        rows = Book.objects.with_availability().filter(id__in=[book.id for book in books]).annotate(
+            open_items=Count('transactionitem', filter=Q(
+                transactionitem__status='borrowed',
+                transactionitem__transaction__approval_status__in=['pending', 'approved']
+            ))
+        )
+        problems = 0
+        self.stdout.write('')
+        for book in rows:
+            expected = book.copies_total - book.open_items
+            if book.open_items > book.copies_total or book.availability < 0:
+                problems += 1
+                self.stdout.write(self.style.ERROR(
+                    f'OVERSELL {book.isbn}: {book.open_items} open loans of {book.copies_total} copies, '
+                    f'available={book.availability}'
+                ))
+            elif book.availability != expected:
+                problems += 1
+                self.stdout.write(self.style.ERROR(
+                    f'LOST UPDATE {book.isbn}: available={book.availability}, expected {expected}'
+                ))
+        if problems:
+            self.stdout.write(self.style.ERROR(f'{problems} book(s) with inconsistent inventory'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Inventory consistent for all load-test books'))
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from library.models import Hold
+
+
+class Command(BaseCommand):
+    help = 'Email students whose holds are ready for pickup and expire holds not collected in time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Days a ready hold waits for pickup (default: HOLD_PICKUP_DAYS)')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.HOLD_PICKUP_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+        # Expired copies pass to the next student in the queue, who is notified below.
+        stale = list(Hold.objects.filter(status='ready', ready_at__lt=cutoff).values_list('id', flat=True))
+        expired = Hold.close(stale, 'expired')
+        # A ready hold whose copy was deleted keeps its place at the head of
+        # the queue and waits for the next returned copy.
+        requeued = Hold.objects.filter(status='ready', copy__isnull=True).update(status='waiting', ready_at=None, notified_at=None)
+        
+        sent_count = 0
+        ready = Hold.objects.filter(status='ready', notified_at__isnull=True).select_related('book', 'copy', 'student__user')
+        for hold in ready:
+            user = hold.student.user
+            if user and user.email:
+                try:
+                    send_mail(
+                        'Your Library Hold Is Ready',
+                        f"""Dear {hold.student.get_full_name()},
+
+A copy of the book you placed a hold on is waiting for you at the counter:
+
+Book: {hold.book.title}
+Author: {hold.book.author}
+Copy: {hold.copy.barcode}
+
+Please collect it within {days} day(s), after which it passes to the next student in the queue.
+
+Thank you,
+Library Management System
+""",
+                        settings.DEFAULT_FROM_EMAIL,
+                        [user.email],
+                        fail_silently=False,
+                    )
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Failed to notify {hold.student.student_id}: {str(e)}'))
+                    continue
+                sent_count += 1
+            # Students without an email see the hold on their dashboard instead.
+            Hold.objects.filter(id=hold.id).update(notified_at=timezone.now())
+        
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent_count} pickup notice(s), expired {expired} hold(s), re-queued {requeued} hold(s)'))
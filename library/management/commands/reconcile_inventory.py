@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from library.models import Book, Category
+from library.uploads import auto_now_values
+
+
+class Command(BaseCommand):
+    help = "Compare each book's availability with its copies on the shelf, and optionally repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Write the recomputed counts back')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_update when fixing')
+        parser.add_argument('--show', type=int, default=20, help='Number of drifted books to list')
+
+    def counts(self, books):
+        # One grouped aggregate over the (book, status) index for every book;
+        # availability is the copies_available snapshot plus unfolded events.
+        return (
+            books.with_availability().order_by()
+            .annotate(
+                shelved=Count('copies', filter=Q(copies__status='available')),
+                in_circulation=Count('copies', filter=~Q(copies__status='withdrawn')),
+            )
+            .values_list('id', 'isbn', 'copies_total', 'copies_available', 'unfolded_delta', 'shelved', 'in_circulation')
+        )
+
+    def handle(self, *args, **options):
+        rows = self.counts(Book.objects.all())
+        checked = 0
+        drifted = []
+        missing_copies = []
+        for book_id, isbn, copies_total, copies_available, unfolded, shelved, in_circulation in rows.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            if copies_available + unfolded != shelved:
+                # The snapshot that, with the pending events, matches the shelf.
+                drifted.append((book_id, isbn, copies_available + unfolded, shelved, shelved - unfolded))
+            if copies_total != in_circulation:
+                missing_copies.append(book_id)
+
+        for book_id, isbn, available, shelved, snapshot in drifted[:options['show']]:
+            self.stdout.write(f'{isbn} (book #{book_id}): available={available}, on shelf={shelved}')
+        if len(drifted) > options['show']:
+            self.stdout.write(f'... and {len(drifted) - options["show"]} more')
+        if missing_copies:
+            self.stdout.write(self.style.WARNING(
+                f'{len(missing_copies)} book(s) have copies_total out of step with their copies'
+            ))
+
+        if not options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Checked {checked} book(s): {len(drifted)} drifted (run with --fix to repair)'
+            ))
+            return
+
+        # Adding or withdrawing copies records restock/write-off events, which
+        # leave any earlier drift in place, so those books are counted again.
+        for book in Book.objects.filter(id__in=missing_copies):
+            book.sync_copies()
+        stamps = auto_now_values(Book)
+        missing = set(missing_copies)
+        snapshots = {book_id: snapshot for book_id, isbn, available, shelved, snapshot in drifted if book_id not in missing}
+        recounted = self.counts(Book.objects.filter(id__in=missing_copies))
+        for book_id, isbn, copies_total, copies_available, unfolded, shelved, in_circulation in recounted:
+            if copies_available + unfolded != shelved:
+                snapshots[book_id] = shelved - unfolded
+        updates = [Book(id=book_id, copies_available=snapshot, **stamps) for book_id, snapshot in snapshots.items()]
+        Book.objects.bulk_update(updates, ['copies_available', *stamps], batch_size=options['batch_size'])
+        # bulk_update bypasses the signals that keep category counters current.
+        Category.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} book(s): fixed {len(drifted)} drifted, synced copies for {len(missing_copies)}'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from library.popularity import refresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute decayed borrow counts used to rank the catalog by popularity'
+
+    def handle(self, *args, **options):
+        changed = refresh()
+        self.stdout.write(self.style.SUCCESS(f'Updated popularity for {changed} book(s)'))
@@ -0,0 +1,131 @@
+"""
+Media file serving.
+
+Covers, profile photos and the logo are served by Django itself so the
+single-box deployment needs no separate web server. Responses carry an ETag
+and Last-Modified for conditional requests, support single byte ranges, and
+use a precompressed .br/.gz sibling when the client accepts it (see the
+compress_media command).
+
+Content-addressed uploads (see library/storage.py) and their renditions can
+never change under the same URL, so browsers may cache them for a year
+without revalidating. Anything else, such as files uploaded before hashed
+names were introduced, must be revalidated on each use.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_content_addressed
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+# Preferred order when the client accepts more than one.
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = ('text/', 'image/svg+xml', 'application/json', 'application/xml', 'application/javascript')
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag_for(stat):
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, None to ignore it, or False if unsatisfiable."""
+    match = _RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+def _precompressed(request, fullpath):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return encoding, fullpath + suffix
+    return None, fullpath
+
+
+@require_safe
+def serve_media(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = safe_join(settings.MEDIA_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404('File not found')
+
+    stat = os.stat(fullpath)
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+    range_header = request.META.get('HTTP_RANGE')
+
+    # Ranges are only ever served from the uncompressed file.
+    encoding, filename = (None, fullpath)
+    if compressible and not range_header:
+        encoding, filename = _precompressed(request, fullpath)
+    etag = etag_for(stat)
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if is_content_addressed(path) else REVALIDATE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+    if compressible:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+            if header in headers:
+                response[header] = headers[header]
+        return response
+
+    if range_header and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            with open(fullpath, 'rb') as f:
+                f.seek(start)
+                body = f.read(end - start + 1)
+            response = HttpResponse(body, status=206, content_type=content_type, headers=headers)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            return response
+
+    response = FileResponse(open(filename, 'rb'), content_type=content_type, headers=headers)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,198 @@
+"""
+In-memory per-view request metrics.
+
+Each worker process keeps its own histograms; nothing is shared between
+workers or persisted, so numbers reset on restart. RequestMetricsMiddleware
+feeds them and the admin metrics page / Prometheus endpoint read them.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+# Upper bounds in seconds (times) or queries (counts), Prometheus style.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = (
+    ('wall_seconds', 'Wall time spent handling the request', TIME_BUCKETS),
+    ('sql_seconds', 'Cumulative time spent executing SQL', TIME_BUCKETS),
+    ('render_seconds', 'Time spent rendering templates', TIME_BUCKETS),
+    ('queries', 'Number of SQL queries executed', COUNT_BUCKETS),
+)
+
+# Plain event counters, e.g. cache hits, exported as <name>_total.
+COUNTERS = {
+    'catalog_cache_hits': 'student_books pages served from the result cache',
+    'catalog_cache_misses': 'student_books pages that had to query the database',
+}
+
+# Stats of the request currently being handled, read by the SQL wrapper and
+# the template backend below.
+current_request = ContextVar('current_request', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'render_seconds', 'render_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_depth = 0
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative(self):
+        total = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            total += bucket_count
+            yield bound, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        self._views = {}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def record(self, view_name, wall_seconds, stats):
+        values = (wall_seconds, stats.sql_seconds, stats.render_seconds, stats.queries)
+        with self._lock:
+            histograms = self._views.get(view_name)
+            if histograms is None:
+                histograms = self._views[view_name] = [Histogram(buckets) for _, _, buckets in METRICS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def snapshot(self):
+        """Return one summary dict per view, slowest total wall time first."""
+        with self._lock:
+            rows = []
+            for view_name, (wall, sql, render, queries) in self._views.items():
+                rows.append({
+                    'view': view_name,
+                    'requests': wall.count,
+                    'total_seconds': wall.sum,
+                    'wall_mean_ms': wall.mean() * 1000,
+                    'wall_p50_ms': wall.quantile(0.5) * 1000,
+                    'wall_p95_ms': wall.quantile(0.95) * 1000,
+                    'sql_mean_ms': sql.mean() * 1000,
+                    'render_mean_ms': render.mean() * 1000,
+                    'queries_mean': queries.mean(),
+                })
+        rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+        return rows
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for index, (name, help_text, _) in enumerate(METRICS):
+                metric = f'library_request_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for view_name in sorted(self._views):
+                    histogram = self._views[view_name][index]
+                    label = view_name.replace('\\', '\\\\').replace('"', '\\"')
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_bucket{{view="{label}",le="{le}"}} {total}')
+                    lines.append(f'{metric}_sum{{view="{label}"}} {histogram.sum!r}')
+                    lines.append(f'{metric}_count{{view="{label}"}} {histogram.count}')
+            for name, help_text in COUNTERS.items():
+                metric = f'library_{name}_total'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric} {self._counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def sql_timer(execute, sql, params, many, context):
+    """connection.execute_wrapper() hook that charges SQL time to the current request."""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_seconds += perf_counter() - start
+        stats.queries += 1
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_request.get()
+        if stats is None:
+            return super().render(context, request)
+        # Templates rendered from inside another template (crispy forms,
+        # includes via render_to_string) are already covered by the outer one.
+        stats.render_depth += 1
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_depth -= 1
+            if not stats.render_depth:
+                stats.render_seconds += perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that reports render time to RequestMetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
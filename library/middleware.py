@@ -0,0 +1,111 @@
+import cProfile
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import RequestStats, current_request, registry, sql_timer
+from . import profiling, slow_queries
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, SQL query count, SQL time and template render time for
+    every request, aggregated per view into the in-memory metrics registry.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(sql_timer):
+                response = self.get_response(request)
+        finally:
+            wall_seconds = perf_counter() - start
+            current_request.reset(token)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        registry.record(view_name, wall_seconds, stats)
+        return response
+
+
+class SlowQueryLogMiddleware:
+    """
+    Log statements slower than SLOW_QUERY_THRESHOLD_MS, with the view that
+    issued them and an EXPLAIN plan captured after the response is built.
+    """
+
+    def __init__(self, get_response):
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0)
+        if not self.threshold_ms:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = slow_queries.SlowQueryCollector(self.threshold_ms)
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+
+        if collector.statements:
+            match = request.resolver_match
+            view_name = match.view_name if match else '<unresolved>'
+            slow_queries.submit(view_name, collector.statements)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run a single request under cProfile when it carries a valid admin-issued
+    token in the PROFILE_QUERY_PARAM query parameter, and store the stats.
+    Anonymous requests are never profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.param = getattr(settings, 'PROFILE_QUERY_PARAM', 'profile')
+
+    def __call__(self, request):
+        token = request.GET.get(self.param)
+        if not token or not request.user.is_authenticated:
+            return self.get_response(request)
+
+        issuer = profiling.token_issuer(token)
+        if issuer is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration_ms = (perf_counter() - start) * 1000
+
+        from .models import ProfileCapture
+
+        query = request.GET.copy()
+        query.pop(self.param, None)
+        path = f'{request.path}?{query.urlencode()}' if query else request.path
+
+        match = request.resolver_match
+        capture = ProfileCapture.objects.create(
+            path=path[:500],
+            view_name=match.view_name if match else '',
+            method=request.method,
+            issued_by=issuer,
+            requested_by=request.user,
+            duration_ms=duration_ms,
+            stats=profiling.dump_stats(profiler),
+        )
+        ProfileCapture.trim()
+        response['X-Profile-Id'] = str(capture.id)
+        return response
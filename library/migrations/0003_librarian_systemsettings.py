@@ -5,6 +5,16 @@ from django.conf import settings
 from django.db import migrations, models
 
 
+def create_missing_tables(apps, schema_editor):
+    # 0001_initial already creates these tables on fresh databases; only
+    # databases that predate it need them added here.
+    existing = schema_editor.connection.introspection.table_names()
+    for model_name in ('Librarian', 'SystemSettings'):
+        model = apps.get_model('library', model_name)
+        if model._meta.db_table not in existing:
+            schema_editor.create_model(model)
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -12,32 +22,39 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.CreateModel(
-            name='Librarian',
-            fields=[
-                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('name', models.CharField(max_length=200)),
-                ('email', models.EmailField(max_length=254)),
-                ('profile_photo', models.ImageField(blank=True, null=True, upload_to='librarian_photos/')),
-                ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_missing_tables, migrations.RunPython.noop),
             ],
-            options={
-                'verbose_name': 'Librarian',
-                'verbose_name_plural': 'Librarians',
-            },
-        ),
-        migrations.CreateModel(
-            name='SystemSettings',
-            fields=[
-                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('system_name', models.CharField(default='Library Management System', max_length=200)),
-                ('system_logo', models.ImageField(blank=True, null=True, upload_to='system/')),
-                ('updated_at', models.DateTimeField(auto_now=True)),
+            state_operations=[
+                migrations.CreateModel(
+                    name='Librarian',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('name', models.CharField(max_length=200)),
+                        ('email', models.EmailField(max_length=254)),
+                        ('profile_photo', models.ImageField(blank=True, null=True, upload_to='librarian_photos/')),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'verbose_name': 'Librarian',
+                        'verbose_name_plural': 'Librarians',
+                    },
+                ),
+                migrations.CreateModel(
+                    name='SystemSettings',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('system_name', models.CharField(default='Library Management System', max_length=200)),
+                        ('system_logo', models.ImageField(blank=True, null=True, upload_to='system/')),
+                        ('updated_at', models.DateTimeField(auto_now=True)),
+                    ],
+                    options={
+                        'verbose_name': 'System Settings',
+                        'verbose_name_plural': 'System Settings',
+                    },
+                ),
             ],
-            options={
-                'verbose_name': 'System Settings',
-                'verbose_name_plural': 'System Settings',
-            },
         ),
     ]
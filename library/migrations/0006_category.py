@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:15
+
+from django.db import migrations, models
+
+
+def backfill_categories(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Category = apps.get_model('library', 'Category')
+    totals = (
+        Book.objects.exclude(category='').values('category')
+        .annotate(books=models.Count('id'), copies=models.Sum('copies_available'))
+    )
+    Category.objects.bulk_create([
+        Category(name=row['category'], book_count=row['books'], available_copies=row['copies'] or 0)
+        for row in totals
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_profilecapture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('book_count', models.IntegerField(default=0)),
+                ('available_copies', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Category',
+                'verbose_name_plural': 'Categories',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
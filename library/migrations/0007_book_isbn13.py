@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:16
+
+import logging
+
+from django.db import migrations, models
+
+from library.isbn import canonical_isbn
+
+
+BATCH_SIZE = 2000
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_isbn13(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    seen = set()
+    batch = []
+    for book in Book.objects.only('id', 'isbn').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        canonical = canonical_isbn(book.isbn)
+        if canonical is not None and canonical in seen:
+            # Same ISBN typed two ways: leave the later row unindexed rather
+            # than failing the unique constraint; it needs merging by hand.
+            logger.warning('Duplicate ISBN %s (book #%s) left without isbn13', book.isbn, book.id)
+            continue
+        seen.add(canonical)
+        book.isbn13 = canonical
+        batch.append(book)
+        if len(batch) >= BATCH_SIZE:
+            Book.objects.bulk_update(batch, ['isbn13'])
+            batch = []
+    Book.objects.bulk_update(batch, ['isbn13'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(backfill_isbn13, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(editable=False, max_length=20, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:18
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def explode_copies(apps, schema_editor):
+    """Create copies_total BookCopy rows per book, attached to its open loans."""
+    Book = apps.get_model('library', 'Book')
+    BookCopy = apps.get_model('library', 'BookCopy')
+    Category = apps.get_model('library', 'Category')
+    TransactionItem = apps.get_model('library', 'TransactionItem')
+
+    open_items = defaultdict(list)
+    for item in (TransactionItem.objects.filter(status='borrowed', transaction__approval_status__in=['approved', 'pending'])
+                 .values('id', 'book_id', 'transaction__approval_status').order_by('id').iterator(chunk_size=BATCH_SIZE)):
+        status = 'borrowed' if item['transaction__approval_status'] == 'approved' else 'pending'
+        open_items[item['book_id']].append((item['id'], status))
+
+    category_deltas = defaultdict(int)
+    books = Book.objects.only('id', 'category', 'copies_total', 'copies_available').order_by('id')
+    for start in range(0, books.count(), BATCH_SIZE):
+        copies, changed = [], []
+        for book in books[start:start + BATCH_SIZE]:
+            loans = open_items.get(book.id, [])[:max(book.copies_total, 0)]
+            for number in range(1, book.copies_total + 1):
+                item_id, status = loans[number - 1] if number <= len(loans) else (None, 'available')
+                copies.append(BookCopy(book_id=book.id, number=number, barcode=f'C{book.id:07d}-{number:03d}',
+                                       status=status, current_item_id=item_id))
+            available = max(book.copies_total, 0) - len(loans)
+            if available != book.copies_available:
+                category_deltas[book.category] += available - book.copies_available
+                book.copies_available = available
+                changed.append(book)
+        BookCopy.objects.bulk_create(copies, batch_size=BATCH_SIZE)
+        Book.objects.bulk_update(changed, ['copies_available'])
+
+    items = [
+        TransactionItem(id=item_id, copy_id=copy_id)
+        for copy_id, item_id in BookCopy.objects.filter(current_item__isnull=False).values_list('id', 'current_item_id')
+    ]
+    TransactionItem.objects.bulk_update(items, ['copy'], batch_size=BATCH_SIZE)
+    for name, delta in category_deltas.items():
+        Category.objects.filter(name=name).update(available_copies=models.F('available_copies') + delta)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_book_isbn13'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('barcode', models.CharField(max_length=50, unique=True)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('pending', 'Pending Approval'), ('borrowed', 'Borrowed'), ('withdrawn', 'Withdrawn')], default='available', max_length=10)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='library.book')),
+                ('current_item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_copy', to='library.transactionitem')),
+            ],
+            options={
+                'verbose_name': 'Book Copy',
+                'verbose_name_plural': 'Book Copies',
+                'ordering': ['book', 'number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transactionitem',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='library.bookcopy'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['book', 'status'], name='library_boo_book_id_a4d6f3_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookcopy',
+            unique_together={('book', 'number')},
+        ),
+        migrations.RunPython(explode_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_bookcopy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('borrow', 'Borrow'), ('return', 'Return'), ('restock', 'Restock'), ('writeoff', 'Write-off')], max_length=10)),
+                ('delta', models.SmallIntegerField()),
+                ('folded', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_events', to='library.book')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_events', to='library.bookcopy')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_events', to='library.transactionitem')),
+            ],
+            options={
+                'verbose_name': 'Inventory Event',
+                'verbose_name_plural': 'Inventory Events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('folded', False)), fields=['book'], name='inventory_event_unfolded_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(max_length=100)),
+                ('course', models.CharField(max_length=100)),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='circulation', to='library.book')),
+            ],
+            options={
+                'verbose_name': 'Daily Circulation',
+                'verbose_name_plural': 'Daily Circulation',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='library_cir_date_115307_idx'), models.Index(fields=['category', 'date'], name='library_cir_categor_69d0e7_idx')],
+                'unique_together': {('date', 'book', 'category', 'course')},
+            },
+        ),
+    ]
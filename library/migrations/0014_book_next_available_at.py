@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+def fill_next_available_at(apps, schema_editor):
+    """Set each book with copies out on loan to the earliest of their due dates."""
+    Book = apps.get_model('library', 'Book')
+    BookCopy = apps.get_model('library', 'BookCopy')
+    earliest = (
+        BookCopy.objects.filter(book=models.OuterRef('pk'), status__in=['pending', 'borrowed'])
+        .order_by('current_item__transaction__due_date').values('current_item__transaction__due_date')[:1]
+    )
+    Book.objects.filter(copies__status__in=['pending', 'borrowed']).update(next_available_at=models.Subquery(earliest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_book_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='next_available_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_next_available_at, migrations.RunPython.noop),
+    ]
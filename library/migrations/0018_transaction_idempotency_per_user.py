@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_postoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('created_by', 'idempotency_key'), name='one_transaction_per_idempotency_key'),
+        ),
+    ]
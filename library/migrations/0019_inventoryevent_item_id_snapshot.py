@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+def fill_item_id_snapshot(apps, schema_editor):
+    InventoryEvent = apps.get_model('library', 'InventoryEvent')
+    InventoryEvent.objects.filter(item__isnull=False).update(item_id_snapshot=models.F('item'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_transaction_idempotency_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryevent',
+            name='item_id_snapshot',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_item_id_snapshot, migrations.RunPython.noop),
+    ]
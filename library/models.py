@@ -1,10 +1,13 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 import random
 import string
 from datetime import timedelta
 
+from .isbn import canonical_isbn
+
 
 class UserManager(BaseUserManager):
     def create_user(self, username, password=None, **extra_fields):
@@ -76,12 +79,72 @@ class Student(models.Model):
         verbose_name = 'Student'
         verbose_name_plural = 'Students'
 
-#hide transactions
-def delete_old_returned_transactions():
-    cutoff = timezone.now() - timedelta(minutes=1)
-    Transaction.objects.filter(status='returned', return_date__lte=cutoff).delete()
+class Category(models.Model):
+    """Materialized view of Book.category, with counters kept current by signals."""
+    name = models.CharField(max_length=100, unique=True)
+    book_count = models.IntegerField(default=0)
+    available_copies = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        verbose_name = 'Category'
+        verbose_name_plural = 'Categories'
+        ordering = ['name']
+    
+    @classmethod
+    def adjust(cls, name, books=0, copies=0):
+        if not name:
+            return
+        counters = {'book_count': models.F('book_count') + books,
+                    'available_copies': models.F('available_copies') + copies}
+        if not cls.objects.filter(name=name).update(**counters):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(**counters)
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every counter from Book, e.g. after bulk updates that bypass signals."""
+        totals = Book.objects.exclude(category='').values('category').annotate(
+            books=models.Count('id'), copies=models.Sum('copies_available')
+        )
+        seen = []
+        for row in totals:
+            cls.objects.update_or_create(
+                name=row['category'], defaults={'book_count': row['books'], 'available_copies': row['copies'] or 0}
+            )
+            seen.append(row['category'])
+        cls.objects.exclude(name__in=seen).update(book_count=0, available_copies=0)
+
+
+class BookQuerySet(models.QuerySet):
+    def with_availability(self):
+        """Annotate the inventory events not yet folded into copies_available (see Book.availability)."""
+        unfolded = (
+            InventoryEvent.objects.filter(book=models.OuterRef('pk'), folded=False).order_by()
+            .values('book').annotate(total=models.Sum('delta')).values('total')
+        )
+        return self.annotate(unfolded_delta=Coalesce(models.Subquery(unfolded), 0))
+
+
+class BookManager(models.Manager.from_queryset(BookQuerySet)):
+    def get_by_isbn(self, isbn):
+        """Find a book from any spelling of its ISBN (hyphenated, ISBN-10 or ISBN-13)."""
+        return self.get(isbn13=canonical_isbn(isbn))
+    
+    def in_bulk_by_isbn(self, isbns):
+        """Map each ISBN in `isbns`, as given, to its book, with one query; unknown ISBNs are left out."""
+        canonical = {isbn: canonical_isbn(isbn) for isbn in isbns}
+        books = self.in_bulk(set(filter(None, canonical.values())), field_name='isbn13')
+        return {isbn: books[isbn13] for isbn, isbn13 in canonical.items() if isbn13 in books}
+
+
 class Book(models.Model):
     isbn = models.CharField(max_length=20, unique=True)
+    # Canonical ISBN-13 derived from `isbn` on save; NULL only for legacy
+    # rows whose ISBN collided with another book's when it was backfilled.
+    isbn13 = models.CharField(max_length=20, unique=True, null=True, editable=False)
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
     category = models.CharField(max_length=100)
@@ -89,21 +152,107 @@ class Book(models.Model):
     year_published = models.IntegerField(blank=True, null=True)
     copies_total = models.IntegerField(default=1)
     copies_available = models.IntegerField(default=1)
+    # Exponentially decayed borrow count, refreshed by refresh_popularity.
+    popularity = models.FloatField(default=0, editable=False)
+    # Earliest due date among copies out on loan (None when none are), so
+    # pages can say when an unavailable book is expected back without
+    # querying its loans. Kept by Book.lent() and Book.refresh_next_available().
+    next_available_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
     description = models.TextField(blank=True)
     book_cover = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed for catalog_version(), which reads the latest change on every catalog hit.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = BookManager()
     
     def __str__(self):
         return f"{self.title} by {self.author}"
     
+    def save(self, *args, **kwargs):
+        if 'isbn' in self.__dict__:
+            self.isbn13 = canonical_isbn(self.isbn)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'isbn' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'isbn13'}
+        super().save(*args, **kwargs)
+    
+    @property
+    def availability(self):
+        """Copies on the shelf: the copies_available snapshot plus inventory events recorded since."""
+        unfolded = self.__dict__.get('unfolded_delta')
+        if unfolded is None:
+            unfolded = self.inventory_events.filter(folded=False).aggregate(total=models.Sum('delta'))['total'] or 0
+        return self.copies_available + unfolded
+    
     def is_available(self):
-        return self.copies_available > 0
+        return self.availability > 0
+    
+    def fold_inventory(self):
+        """Fold this book's pending inventory events into copies_available; returns how many were folded."""
+        folded, totals = InventoryEvent.fold([self.pk])
+        self.copies_available += totals.get(self.pk, 0)
+        self.__dict__.pop('unfolded_delta', None)
+        return folded
+    
+    @classmethod
+    def lent(cls, book_ids, due_date):
+        """A copy of each book has gone out until `due_date`; bring next_available_at forward to it."""
+        cls.objects.filter(
+            models.Q(next_available_at__isnull=True) | models.Q(next_available_at__gt=due_date), id__in=book_ids
+        ).update(next_available_at=due_date, updated_at=timezone.now())
+    
+    @classmethod
+    def refresh_next_available(cls, book_ids, due_date):
+        """A loan due at `due_date` has ended; recompute next_available_at where it was that loan's.
+        
+        Books whose next copy is due back earlier are left alone, so most
+        returns and rejections do not touch the book row.
+        """
+        earliest = (
+            BookCopy.objects.filter(book=models.OuterRef('pk'), status__in=['pending', 'borrowed'])
+            .order_by('current_item__transaction__due_date').values('current_item__transaction__due_date')[:1]
+        )
+        cls.objects.filter(
+            models.Q(next_available_at__isnull=True) | models.Q(next_available_at__gte=due_date), id__in=book_ids
+        ).update(next_available_at=models.Subquery(earliest), updated_at=timezone.now())
+    
+    def sync_copies(self, initial=False):
+        """Add or withdraw copies so that copies_total of them are in circulation.
+        
+        The initial copies of a new book are what its copies_available
+        already counts; later changes are recorded as restocks and write-offs.
+        """
+        in_circulation = self.copies.exclude(status='withdrawn')
+        missing = self.copies_total - in_circulation.count()
+        if missing > 0:
+            start = self.copies.count() + 1
+            changed = BookCopy.objects.bulk_create([
+                BookCopy(book=self, number=number, barcode=BookCopy.make_barcode(self.id, number))
+                for number in range(start, start + missing)
+            ])
+            kind = 'restock'
+        elif missing < 0:
+            # Only copies on the shelf can be withdrawn.
+            changed = list(in_circulation.filter(status='available').order_by('-number')[:-missing])
+            BookCopy.objects.filter(id__in=[copy.id for copy in changed]).update(status='withdrawn')
+            kind = 'writeoff'
+        else:
+            return
+        if initial:
+            available = self.copies.filter(status='available').count()
+            if available != self.copies_available:
+                self.copies_available = available
+                self.save(update_fields=['copies_available', 'updated_at'])
+        else:
+            InventoryEvent.record(changed, kind)
+            self.fold_inventory()
     
     class Meta:
         verbose_name = 'Book'
         verbose_name_plural = 'Books'
         ordering = ['title']
+        indexes = [models.Index(fields=['category', '-popularity']), models.Index(fields=['-popularity'])]
 
 
 class Transaction(models.Model):
@@ -129,9 +278,17 @@ class Transaction(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     reminder_sent = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Issued with the POS confirm step, so a resubmitted confirm finds this
+    # transaction instead of creating a second one.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
     
     def __str__(self):
-        book_count = self.items.count()
+        # Use prefetched items when the caller loaded them (e.g. the admin
+        # changelist); otherwise a COUNT is cheaper than fetching every item.
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            book_count = len(self.items.all())
+        else:
+            book_count = self.items.count()
         return f"{self.transaction_code} - {self.student.student_id} - {book_count} book(s)"
     
     def is_overdue(self):
@@ -155,6 +312,12 @@ class Transaction(models.Model):
         verbose_name = 'Transaction'
         verbose_name_plural = 'Transactions'
         ordering = ['-borrowed_date']
+        constraints = [
+            # Keys are chosen by each terminal, so they are only unique per account.
+            models.UniqueConstraint(
+                fields=['created_by', 'idempotency_key'], name='one_transaction_per_idempotency_key'
+            ),
+        ]
 
 
 class TransactionItem(models.Model):
@@ -163,6 +326,7 @@ class TransactionItem(models.Model):
     borrowed_date = models.DateTimeField(default=timezone.now)
     return_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES, default='borrowed')
+    copy = models.ForeignKey('BookCopy', on_delete=models.SET_NULL, null=True, blank=True, related_name='items')
     
     def __str__(self):
         return f"{self.transaction.transaction_code} - {self.book.title}"
@@ -176,6 +340,333 @@ class TransactionItem(models.Model):
         ordering = ['book__title']
 
 
+class ArchivedTransaction(models.Model):
+    """A closed (returned or rejected) Transaction moved out of the live table.
+    
+    Archived rows keep their original id, so an archived transaction and
+    its items are found by the same keys as before. See library/archive.py.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    transaction_code = models.CharField(max_length=50, unique=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='archived_transactions')
+    borrowed_date = models.DateTimeField()
+    due_date = models.DateTimeField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES)
+    approval_status = models.CharField(max_length=10, choices=Transaction.APPROVAL_STATUS_CHOICES)
+    approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    approved_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.transaction_code} - {self.student_id} (archived)"
+    
+    def get_book_titles(self):
+        return ", ".join([item.book.title for item in self.items.all()])
+    
+    class Meta:
+        verbose_name = 'Archived Transaction'
+        verbose_name_plural = 'Archived Transactions'
+        ordering = ['-borrowed_date']
+        indexes = [models.Index(fields=['student', '-borrowed_date'])]
+
+
+class ArchivedTransactionItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    transaction = models.ForeignKey(ArchivedTransaction, on_delete=models.CASCADE, related_name='items')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_items')
+    copy = models.ForeignKey('BookCopy', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    borrowed_date = models.DateTimeField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES)
+    
+    def __str__(self):
+        return f"{self.transaction.transaction_code} - {self.book.title}"
+    
+    class Meta:
+        verbose_name = 'Archived Transaction Item'
+        verbose_name_plural = 'Archived Transaction Items'
+        ordering = ['book__title']
+
+
+class BookCopy(models.Model):
+    """One physical copy of a book, identified by the barcode on its label."""
+    STATUS_CHOICES = (
+        ('available', 'Available'),
+        ('pending', 'Pending Approval'),
+        ('borrowed', 'Borrowed'),
+        ('held', 'On Hold Shelf'),
+        ('withdrawn', 'Withdrawn'),
+    )
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    number = models.PositiveIntegerField()
+    barcode = models.CharField(max_length=50, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='available')
+    current_item = models.OneToOneField(
+        TransactionItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='current_copy'
+    )
+    
+    def __str__(self):
+        return f"{self.barcode} - {self.book.title}"
+    
+    @staticmethod
+    def make_barcode(book_id, number):
+        return f"C{book_id:07d}-{number:03d}"
+    
+    @classmethod
+    def release(cls, item, user=None):
+        """Pass the copy held for `item` to the next hold on its book, or put it back on the shelf.
+        
+        Returns the holds it was set aside for.
+        """
+        from django.db import transaction
+        with transaction.atomic():
+            copies = list(cls.objects.select_for_update().filter(current_item=item))
+            served = cls.put_back(copies, user)
+            Book.refresh_next_available({copy.book_id for copy in copies}, item.transaction.due_date)
+        return served
+    
+    @classmethod
+    def put_back(cls, copies, user=None):
+        """Give each of these locked copies to the oldest waiting hold on its book, else shelve it.
+        
+        Copies set aside for a hold never reach the shelf, so only shelved
+        ones record a return event. Returns the holds served.
+        """
+        served = Hold.allocate(copies)
+        held = {hold.copy_id for hold in served}
+        shelved = [copy for copy in copies if copy.id not in held]
+        InventoryEvent.record(shelved, 'return', user)
+        cls.objects.filter(id__in=held).update(status='held', current_item=None)
+        cls.objects.filter(id__in=[copy.id for copy in shelved]).update(status='available', current_item=None)
+        return served
+    
+    class Meta:
+        verbose_name = 'Book Copy'
+        verbose_name_plural = 'Book Copies'
+        ordering = ['book', 'number']
+        unique_together = ['book', 'number']
+        indexes = [models.Index(fields=['book', 'status'])]
+
+
+class InventoryEvent(models.Model):
+    """Append-only ledger of changes to the number of copies on the shelf.
+    
+    Borrowing and returning insert a row here instead of updating the book,
+    so busy titles do not contend on one row. compact_inventory folds
+    pending events into Book.copies_available and marks them folded; they
+    are kept as the audit trail.
+    """
+    KIND_CHOICES = (
+        ('borrow', 'Borrow'),
+        ('return', 'Return'),
+        ('restock', 'Restock'),
+        ('writeoff', 'Write-off'),
+    )
+    DELTAS = {'borrow': -1, 'return': 1, 'restock': 1, 'writeoff': -1}
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='inventory_events')
+    copy = models.ForeignKey(BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_events')
+    item = models.ForeignKey(TransactionItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_events')
+    # The item's id, kept when archive_transactions moves the item (under the
+    # same id) to ArchivedTransactionItem and the foreign key above is cleared.
+    item_id_snapshot = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    delta = models.SmallIntegerField()
+    folded = models.BooleanField(default=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.delta:+d} - {self.book_id}"
+    
+    @classmethod
+    def record(cls, copies, kind, user=None):
+        """Insert one event per copy; each copy's current_item is recorded with it."""
+        return cls.objects.bulk_create([
+            cls(book_id=copy.book_id, copy=copy, item_id=copy.current_item_id, item_id_snapshot=copy.current_item_id,
+                kind=kind, delta=cls.DELTAS[kind], created_by=user)
+            for copy in copies
+        ])
+    
+    @classmethod
+    def fold(cls, book_ids):
+        """Fold pending events for `book_ids` into their books' copies_available.
+        
+        Returns (events folded, {book id: total delta}).
+        """
+        from django.db import transaction
+        with transaction.atomic():
+            # Only compaction locks book rows; the events themselves are append-only.
+            categories = dict(Book.objects.select_for_update().filter(id__in=book_ids).values_list('id', 'category'))
+            events = list(cls.objects.filter(book__in=book_ids, folded=False).values_list('id', 'book_id', 'delta'))
+            totals = {}
+            for event_id, book_id, delta in events:
+                totals[book_id] = totals.get(book_id, 0) + delta
+            # One UPDATE per distinct total, which is nearly always -1 or +1.
+            by_total = {}
+            for book_id, total in totals.items():
+                by_total.setdefault(total, []).append(book_id)
+            now = timezone.now()
+            for total, ids in by_total.items():
+                Book.objects.filter(id__in=ids).update(copies_available=models.F('copies_available') + total, updated_at=now)
+            cls.objects.filter(id__in=[event_id for event_id, book_id, delta in events]).update(folded=True)
+            # Queryset updates bypass the signals that keep Category counters current.
+            by_category = {}
+            for book_id, total in totals.items():
+                by_category[categories[book_id]] = by_category.get(categories[book_id], 0) + total
+            for category, total in by_category.items():
+                Category.adjust(category, copies=total)
+        return len(events), totals
+    
+    class Meta:
+        verbose_name = 'Inventory Event'
+        verbose_name_plural = 'Inventory Events'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['book'], condition=models.Q(folded=False), name='inventory_event_unfolded_idx'),
+        ]
+
+
+class Hold(models.Model):
+    """A student's place in the first-come, first-served queue for a book.
+    
+    A copy coming back from loan goes to the oldest waiting hold instead of
+    the shelf (BookCopy.put_back), making that hold ready for pickup. Ready
+    holds not yet notified are the outbox that process_holds emails from;
+    it also expires holds not collected within HOLD_PICKUP_DAYS.
+    """
+    STATUS_CHOICES = (
+        ('waiting', 'Waiting'),
+        ('ready', 'Ready for Pickup'),
+        ('collected', 'Collected'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
+    )
+    OPEN_STATUSES = ('waiting', 'ready')
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    copy = models.ForeignKey(BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='holds')
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.student.student_id} - {self.book.title} ({self.get_status_display()})"
+    
+    @classmethod
+    def allocate(cls, copies):
+        """Make the head of each copy's queue ready with that copy; returns the holds served.
+        
+        Must run inside the transaction that locked `copies`. The head is
+        found with one seek on the waiting-queue index, and holds already
+        locked by a concurrent return of the same title are skipped so each
+        copy goes to a different student.
+        """
+        served = []
+        for copy in copies:
+            head = (
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(book_id=copy.book_id, status='waiting').order_by('created_at', 'id').first()
+            )
+            if head is None:
+                continue
+            head.status, head.copy, head.ready_at = 'ready', copy, timezone.now()
+            head.save(update_fields=['status', 'copy', 'ready_at'])
+            served.append(head)
+        # No inventory event marks a copy going to the hold shelf, so the
+        # catalog version has to move with the book instead.
+        Book.objects.filter(id__in={hold.book_id for hold in served}).update(updated_at=timezone.now())
+        return served
+    
+    @classmethod
+    def close(cls, hold_ids, status, user=None):
+        """Move these open holds to `status`; copies they had set aside go to the next in line."""
+        from django.db import transaction
+        with transaction.atomic():
+            holds = list(cls.objects.select_for_update().filter(id__in=hold_ids, status__in=cls.OPEN_STATUSES))
+            cls.objects.filter(id__in=[hold.id for hold in holds]).update(status=status)
+            set_aside = [hold.copy_id for hold in holds if hold.status == 'ready']
+            BookCopy.put_back(list(BookCopy.objects.select_for_update().filter(id__in=set_aside, status='held')), user)
+        return len(holds)
+    
+    class Meta:
+        verbose_name = 'Hold'
+        verbose_name_plural = 'Holds'
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['book', 'created_at'], condition=models.Q(status='waiting'), name='hold_queue_idx'),
+            models.Index(fields=['status', 'ready_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'student'], condition=models.Q(status__in=['waiting', 'ready']),
+                                    name='one_open_hold_per_student'),
+        ]
+
+
+class CirculationDaily(models.Model):
+    """Borrows and returns per day, book, category and student course, for analytics.
+    
+    Kept current by approve_transaction and the POS return; rebuilt from
+    the live and archived transaction items by backfill_circulation.
+    """
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='circulation')
+    category = models.CharField(max_length=100)
+    course = models.CharField(max_length=100)
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.date} - {self.book_id} - {self.course}"
+    
+    class Meta:
+        verbose_name = 'Daily Circulation'
+        verbose_name_plural = 'Daily Circulation'
+        ordering = ['-date']
+        unique_together = ['date', 'book', 'category', 'course']
+        indexes = [models.Index(fields=['date']), models.Index(fields=['category', 'date'])]
+    
+    @classmethod
+    def add(cls, when, book, course, borrows=0, returns=0):
+        """Count borrows/returns once the surrounding transaction commits.
+        
+        Every loan of a book on the same day updates the same row, so the
+        update runs after the approval or return has committed instead of
+        holding that row lock for the rest of it.
+        """
+        from django.db import transaction
+        key = {'date': timezone.localdate(when), 'book_id': book.id, 'category': book.category, 'course': course}
+        counters = {'borrows': models.F('borrows') + borrows, 'returns': models.F('returns') + returns}
+        
+        def apply():
+            if not cls.objects.filter(**key).update(**counters):
+                cls.objects.get_or_create(**key)
+                cls.objects.filter(**key).update(**counters)
+        transaction.on_commit(apply)
+
+
+class BookRecommendation(models.Model):
+    """"Students who borrowed this also borrowed": the top-k books per book (library/recommendations.py)."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    co_borrowers = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_id} ({self.score:.3f})"
+    
+    class Meta:
+        verbose_name = 'Book Recommendation'
+        verbose_name_plural = 'Book Recommendations'
+        ordering = ['book', '-score']
+        unique_together = ['book', 'recommended']
+
+
 class VerificationCode(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     code = models.CharField(max_length=6)
@@ -268,3 +759,85 @@ class AdminLog(models.Model):
         verbose_name = 'Admin Log'
         verbose_name_plural = 'Admin Logs'
         ordering = ['-timestamp']
+
+
+class SlowQuery(models.Model):
+    view_name = models.CharField(max_length=200)
+    fingerprint = models.CharField(max_length=40, db_index=True)
+    table_name = models.CharField(max_length=100, blank=True)
+    normalized_sql = models.TextField()
+    duration_ms = models.FloatField()
+    explain = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.view_name} - {self.duration_ms:.0f} ms"
+    
+    class Meta:
+        verbose_name = 'Slow Query'
+        verbose_name_plural = 'Slow Queries'
+        ordering = ['-created_at']
+
+
+class ProfileCapture(models.Model):
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    method = models.CharField(max_length=10)
+    issued_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='issued_profile_captures')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='profile_captures')
+    duration_ms = models.FloatField()
+    stats = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.method} {self.path} - {self.duration_ms:.0f} ms"
+    
+    @classmethod
+    def trim(cls):
+        from django.conf import settings
+        max_rows = getattr(settings, 'PROFILE_CAPTURE_MAX_ROWS', 50)
+        cutoff = list(cls.objects.order_by('-id').values_list('id', flat=True)[max_rows:max_rows + 1])
+        if cutoff:
+            cls.objects.filter(id__lte=cutoff[0]).delete()
+    
+    class Meta:
+        verbose_name = 'Profile Capture'
+        verbose_name_plural = 'Profile Captures'
+        ordering = ['-created_at']
+
+
+class PosToken(models.Model):
+    """API key for a POS terminal using library/api.py; only its SHA-256 digest is stored."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pos_tokens', limit_choices_to={'user_type': 'pos'})
+    name = models.CharField(max_length=100, blank=True)
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.name or 'terminal'}"
+    
+    @staticmethod
+    def hash(key):
+        import hashlib
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    @classmethod
+    def issue(cls, user, name=''):
+        """Create a token for `user` and return its key, which is not stored and cannot be shown again."""
+        import secrets
+        key = secrets.token_urlsafe(32)
+        cls.objects.create(user=user, name=name, digest=cls.hash(key))
+        return key
+    
+    @classmethod
+    def authenticate(cls, key):
+        """The active POS user `key` was issued to, or None."""
+        token = cls.objects.select_related('user').filter(
+            digest=cls.hash(key), user__user_type='pos', user__is_active=True
+        ).first()
+        return token.user if token else None
+    
+    class Meta:
+        verbose_name = 'POS API Token'
+        verbose_name_plural = 'POS API Tokens'
+        ordering = ['-created_at']
@@ -0,0 +1,70 @@
+"""
+Popularity scores for catalog ranking.
+
+A book's popularity is its borrow count with each borrow weighted by
+0.5 ** (age in days / POPULARITY_HALF_LIFE_DAYS), so last week's loans
+outweigh last year's. The daily borrow counts come from the
+CirculationDaily rollup (which already covers live and archived items)
+rather than from transaction items, and borrows older than
+POPULARITY_WINDOW_HALF_LIVES half-lives are ignored as negligible.
+
+refresh() stores the scores on Book.popularity, so the catalog can sort
+on the (category, popularity) index without aggregating per request.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import catalog
+from .models import Book, CirculationDaily
+from .uploads import auto_now_values
+
+
+BATCH_SIZE = 2000
+
+
+def _half_life():
+    return getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 30)
+
+
+def _window_half_lives():
+    return getattr(settings, 'POPULARITY_WINDOW_HALF_LIVES', 8)
+
+
+def scores(today=None):
+    """{book id: decayed borrow count} for books borrowed within the window."""
+    today = today or timezone.localdate()
+    half_life = _half_life()
+    since = today - timedelta(days=half_life * _window_half_lives())
+    daily = (
+        CirculationDaily.objects.filter(date__gte=since, borrows__gt=0).order_by()
+        .values_list('book_id', 'date').annotate(borrows=Sum('borrows'))
+    )
+    result = defaultdict(float)
+    for book_id, day, borrows in daily.iterator(chunk_size=BATCH_SIZE):
+        result[book_id] += borrows * 0.5 ** ((today - day).days / half_life)
+    # Rounded so that a score which has not really moved is not rewritten.
+    return {book_id: round(score, 4) for book_id, score in result.items()}
+
+
+def refresh(today=None):
+    """Store current popularity on every book whose score changed; returns how many changed."""
+    fresh = scores(today)
+    current = Book.objects.order_by().values_list('id', 'category', 'popularity')
+    stamps = auto_now_values(Book)
+    changed, categories = [], set()
+    for book_id, category, popularity in current.iterator(chunk_size=BATCH_SIZE):
+        score = fresh.get(book_id, 0)
+        if score != popularity:
+            changed.append(Book(id=book_id, popularity=score, **stamps))
+            categories.add(category)
+    with transaction.atomic():
+        Book.objects.bulk_update(changed, ['popularity', *stamps], batch_size=BATCH_SIZE)
+    # bulk_update bypasses the signals that retire cached catalog pages.
+    if changed:
+        catalog.invalidate(*categories)
+    return len(changed)
@@ -0,0 +1,69 @@
+"""
+On-demand cProfile capture.
+
+An admin issues a signed token from the profiling page; appending
+?profile=<token> to any URL makes ProfilingMiddleware run that single request
+under cProfile and store the stats as a ProfileCapture. Each token profiles
+one request of a logged-in user and is then spent, and unused tokens expire
+after PROFILE_TOKEN_MAX_AGE seconds, so a leaked link cannot be replayed.
+"""
+import hashlib
+import marshal
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+
+SIGNING_SALT = 'library.profiling'
+
+SORT_KEYS = {
+    'cumulative': lambda row: row['cumtime'],
+    'tottime': lambda row: row['tottime'],
+    'calls': lambda row: row['ncalls'],
+}
+
+
+def make_token(user):
+    # The nonce makes every token distinct, so spending one spends no other.
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(f'{user.pk}:{secrets.token_hex(8)}')
+
+
+def token_issuer(token):
+    """Spend `token` and return the admin who issued it, or None if it is invalid, expired or spent."""
+    from .models import User
+
+    max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)
+    try:
+        user_id, _, nonce = signing.TimestampSigner(salt=SIGNING_SALT).unsign(token, max_age=max_age).partition(':')
+    except signing.BadSignature:
+        return None
+    issuer = User.objects.filter(pk=user_id, user_type='admin', is_active=True).first()
+    if issuer is None or not nonce:
+        return None
+    # Remembered only as long as the token could still be accepted.
+    spent_key = 'profiling:spent:' + hashlib.sha1(token.encode()).hexdigest()
+    return issuer if cache.add(spent_key, True, max_age) else None
+
+
+def dump_stats(profiler):
+    """Serialize a finished profiler in the same format as pstats.Stats.dump_stats()."""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def stats_rows(data, sort='cumulative', limit=100):
+    """Turn dumped stats into table rows sorted by `sort`, largest first."""
+    rows = []
+    for (filename, lineno, funcname), (primitive_calls, ncalls, tottime, cumtime, _) in marshal.loads(data).items():
+        rows.append({
+            'function': f'{filename}:{lineno}({funcname})' if lineno else funcname,
+            'ncalls': ncalls,
+            'primitive_calls': primitive_calls,
+            'tottime': tottime,
+            'cumtime': cumtime,
+            'percall': cumtime / ncalls if ncalls else 0.0,
+        })
+    rows.sort(key=SORT_KEYS.get(sort, SORT_KEYS['cumulative']), reverse=True)
+    return rows[:limit]
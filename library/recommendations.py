@@ -0,0 +1,178 @@
+"""
+Co-borrowing recommendations.
+
+Each approved loan (live or archived) marks a (student, book) cell of a
+sparse borrow matrix, held as one set of book ids per student. The
+co-borrow count of books A and B is the number of students who have
+borrowed both, and their similarity is the cosine of their student
+vectors: co_borrowers / sqrt(borrowers(A) * borrowers(B)). The top
+RECOMMENDATIONS_PER_BOOK books by similarity are stored per book in
+BookRecommendation, which the student dashboard reads with one query.
+
+rebuild() recomputes every book. update() rescores only the books held
+by students who have had loans approved since the last run and the books
+whose lists recommend a newly borrowed book, since those are the only lists
+a new borrow can change. It reads just the rows of those books' readers,
+unless they are most of the students anyway.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ArchivedTransactionItem, BookRecommendation, Student, TransactionItem
+
+
+BATCH_SIZE = 5000
+
+
+def _per_book():
+    return getattr(settings, 'RECOMMENDATIONS_PER_BOOK', 10)
+
+
+def _min_co_borrowers():
+    return getattr(settings, 'RECOMMENDATIONS_MIN_CO_BORROWERS', 2)
+
+
+def borrow_matrix(student_ids=None, book_ids=None):
+    """Return ({student id: set of book ids}, {book id: set of student ids}) for approved loans.
+
+    Restricting to `student_ids` gives complete rows, and to `book_ids`
+    complete columns, for just those students or books.
+    """
+    baskets = defaultdict(set)
+    for model in (TransactionItem, ArchivedTransactionItem):
+        items = model.objects.filter(transaction__approval_status='approved')
+        if student_ids is not None:
+            items = items.filter(transaction__student_id__in=student_ids)
+        if book_ids is not None:
+            items = items.filter(book_id__in=book_ids)
+        cells = items.order_by().values_list('transaction__student_id', 'book_id').distinct()
+        for student_id, book_id in cells.iterator(chunk_size=BATCH_SIZE):
+            baskets[student_id].add(book_id)
+    borrowers = defaultdict(set)
+    for student_id, books in baskets.items():
+        for book_id in books:
+            borrowers[book_id].add(student_id)
+    return baskets, borrowers
+
+
+def borrower_counts(book_ids):
+    """{book id: number of distinct students with an approved loan of it}, counted in the database."""
+    if not book_ids:
+        return {}
+    cells = [
+        model.objects.filter(transaction__approval_status='approved', book_id__in=book_ids)
+        .order_by().values('book_id', 'transaction__student_id')
+        for model in (TransactionItem, ArchivedTransactionItem)
+    ]
+    # UNION drops a student's second loan of a book whether it is live or archived.
+    sql, params = cells[0].union(cells[1]).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT book_id, COUNT(*) FROM ({sql}) cells GROUP BY book_id', params)
+        return dict(cursor.fetchall())
+
+
+def co_borrowed(book_id, baskets, borrowers):
+    """Counter of {other book id: students who borrowed both it and `book_id`}."""
+    counts = Counter()
+    for student_id in borrowers[book_id]:
+        counts.update(baskets[student_id])
+    del counts[book_id]
+    return counts
+
+
+def similar_books(book_id, baskets, borrowers, counts, k, min_co_borrowers):
+    """Top `k` (score, co_borrowers, other book id) for `book_id`; `counts` gives each book's borrowers."""
+    readers = len(borrowers[book_id])
+    candidates = (
+        (count / math.sqrt(readers * counts[other]), count, other)
+        for other, count in co_borrowed(book_id, baskets, borrowers).items() if count >= min_co_borrowers
+    )
+    return heapq.nlargest(k, candidates)
+
+
+def _store(book_ids, baskets, borrowers, counts, now):
+    k, min_co_borrowers = _per_book(), _min_co_borrowers()
+    rows = [
+        BookRecommendation(book_id=book_id, recommended_id=other, score=score,
+                           co_borrowers=count, computed_at=now)
+        for book_id in book_ids
+        for score, count, other in similar_books(book_id, baskets, borrowers, counts, k, min_co_borrowers)
+    ]
+    with transaction.atomic():
+        BookRecommendation.objects.filter(book_id__in=book_ids).delete()
+        BookRecommendation.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def rebuild():
+    """Recompute recommendations for every borrowed book; returns (books, rows)."""
+    started = timezone.now()
+    baskets, borrowers = borrow_matrix()
+    with transaction.atomic():
+        BookRecommendation.objects.exclude(book_id__in=list(borrowers)).delete()
+        counts = {book_id: len(borrowers[book_id]) for book_id in borrowers}
+        rows = _store(list(borrowers), baskets, borrowers, counts, started)
+    return len(borrowers), rows
+
+
+def update():
+    """Recompute the books affected by loans approved since the last run; returns (books, rows)."""
+    since = BookRecommendation.objects.aggregate(last=Max('computed_at'))['last']
+    if since is None:
+        return rebuild()
+    # Loans approved while this runs are picked up by the next run.
+    started = timezone.now()
+    students, books = set(), set()
+    for model in (TransactionItem, ArchivedTransactionItem):
+        cells = model.objects.filter(
+            transaction__approval_status='approved', transaction__approved_at__gte=since
+        ).order_by().values_list('transaction__student_id', 'book_id').distinct()
+        for student_id, book_id in cells:
+            students.add(student_id)
+            books.add(book_id)
+    if not students:
+        return 0, 0
+    # A new (student, book) cell changes the co-borrow counts in the list of
+    # every book that student has borrowed, and lowers the book's score in
+    # the lists that already recommend it. Scoring those takes the full rows
+    # of everyone who read them, plus how many students borrowed each book
+    # in those rows.
+    affected = set().union(*borrow_matrix(student_ids=students)[0].values())
+    affected.update(BookRecommendation.objects.filter(recommended__in=books).values_list('book_id', flat=True))
+    readers = set().union(*borrow_matrix(book_ids=affected)[1].values())
+    if len(readers) * 2 > Student.objects.count():
+        # A bestseller was among them: its readers' rows are most of the
+        # matrix, and reading it whole is cheaper than counting each column.
+        baskets, borrowers = borrow_matrix()
+        counts = {book_id: len(borrowers[book_id]) for book_id in borrowers}
+    else:
+        baskets, borrowers = borrow_matrix(student_ids=readers)
+        # Only books co-borrowed often enough to be scored need counting.
+        min_co_borrowers = _min_co_borrowers()
+        candidates = {
+            other for book_id in affected
+            for other, count in co_borrowed(book_id, baskets, borrowers).items() if count >= min_co_borrowers
+        }
+        counts = borrower_counts(candidates - affected)
+        counts.update((book_id, len(borrowers[book_id])) for book_id in affected)
+    return len(affected), _store(list(affected), baskets, borrowers, counts, started)
+
+
+def for_student(book_ids, limit=6):
+    """Books recommended from the books in `book_ids`, best first, excluding those books."""
+    rows = (
+        BookRecommendation.objects.filter(book_id__in=book_ids).exclude(recommended_id__in=book_ids)
+        .select_related('recommended').order_by('-score')
+    )
+    picks = {}
+    for row in rows[:limit * 5]:
+        picks.setdefault(row.recommended_id, row.recommended)
+        if len(picks) == limit:
+            break
+    return list(picks.values())
@@ -0,0 +1,98 @@
+"""
+Resized copies ("renditions") of uploaded images.
+
+Covers, profile photos and the system logo are stored at whatever size they
+were uploaded, but pages only ever show them in small slots. Every image gets
+RENDITION_WIDTHS copies in WebP and JPEG under MEDIA_ROOT/renditions/, named
+after the original file so a URL can be built without touching the disk.
+They are written when the owning model is saved and, for files uploaded
+before renditions existed, the first time a page asks for them.
+"""
+import logging
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'renditions'
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+# File name -> whether its renditions are on disk, so templates only touch
+# the filesystem the first time this worker renders a given image.
+_known = {}
+_lock = threading.Lock()
+
+
+def widths():
+    return tuple(getattr(settings, 'RENDITION_WIDTHS', (64, 128, 320, 640)))
+
+
+def rendition_name(name, width, ext='jpg'):
+    root, _ = os.path.splitext(name)
+    return f'{RENDITION_DIR}/{root}.{width}w.{ext}'
+
+
+def rendition_url(field_file, width, ext='jpg'):
+    return field_file.storage.url(rendition_name(field_file.name, width, ext))
+
+
+def srcset(field_file, ext='jpg'):
+    return ', '.join(f'{rendition_url(field_file, width, ext)} {width}w' for width in widths())
+
+
+def _encode(image, width, fmt):
+    copy = image.copy()
+    copy.thumbnail((width, width * 2), Image.Resampling.LANCZOS)
+    has_alpha = copy.mode in ('RGBA', 'LA') or (copy.mode == 'P' and 'transparency' in copy.info)
+    if fmt == 'JPEG' and has_alpha:
+        copy = copy.convert('RGBA')
+        background = Image.new('RGB', copy.size, (255, 255, 255))
+        background.paste(copy, mask=copy.getchannel('A'))
+        copy = background
+    elif copy.mode not in ('RGB', 'RGBA'):
+        copy = copy.convert('RGBA' if has_alpha else 'RGB')
+    buffer = BytesIO()
+    copy.save(buffer, fmt, quality=getattr(settings, 'RENDITION_QUALITY', 80), optimize=fmt == 'JPEG')
+    return buffer.getvalue()
+
+
+def generate(field_file):
+    """Write every missing rendition of `field_file`."""
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    # The largest JPEG is written last and doubles as the "all done" marker.
+    for ext, fmt in FORMATS.items():
+        for width in widths():
+            name = rendition_name(field_file.name, width, ext)
+            if not storage.exists(name):
+                storage.save(name, ContentFile(_encode(image, width, fmt)))
+
+
+def ensure(field_file):
+    """Make sure renditions exist for `field_file`; False if it can't be read as an image."""
+    if not field_file:
+        return False
+    if field_file.name in _known:
+        return _known[field_file.name]
+    marker = rendition_name(field_file.name, widths()[-1], 'jpg')
+    with _lock:
+        if not field_file.storage.exists(marker):
+            try:
+                generate(field_file)
+            except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError):
+                logger.warning('Could not generate renditions for %s', field_file.name, exc_info=True)
+                _known[field_file.name] = False
+                return False
+        _known[field_file.name] = True
+    return True
+
@@ -0,0 +1,93 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import ImageField
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import catalog, uploads
+from .models import Book, Category, Student, Librarian, SystemSettings
+
+
+INDEXED_CATEGORY = catalog.INDEXED_FIELDS.index('category')
+
+
+def image_fields(instance):
+    return [field.name for field in instance._meta.fields if isinstance(field, ImageField)]
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=Student)
+@receiver(pre_save, sender=Librarian)
+@receiver(pre_save, sender=SystemSettings)
+def note_new_uploads(sender, instance, **kwargs):
+    # A freshly assigned upload is still uncommitted here; by post_save it
+    # has been written to storage under its final name.
+    instance._new_uploads = [
+        name for name in image_fields(instance)
+        if getattr(instance, name) and not getattr(instance, name)._committed
+    ]
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Librarian)
+@receiver(post_save, sender=SystemSettings)
+def normalize_new_uploads(sender, instance, **kwargs):
+    for name in instance.__dict__.pop('_new_uploads', []):
+        transaction.on_commit(partial(uploads.submit, instance, name))
+
+
+@receiver(post_init, sender=Book)
+def remember_indexed_values(sender, instance, **kwargs):
+    instance._indexed_values = catalog.indexed_values(instance)
+    instance._category_state = (instance.__dict__.get('category'), instance.__dict__.get('copies_available'))
+    instance._copies_total = instance.__dict__.get('copies_total')
+
+
+@receiver(post_save, sender=Book)
+def invalidate_catalog_on_save(sender, instance, created, **kwargs):
+    before = instance._indexed_values
+    after = catalog.indexed_values(instance)
+    if created or before != after:
+        catalog.invalidate(before[INDEXED_CATEGORY], after[INDEXED_CATEGORY])
+    instance._indexed_values = after
+
+
+@receiver(pre_delete, sender=Book)
+def invalidate_catalog_on_delete(sender, instance, **kwargs):
+    catalog.invalidate(instance.category)
+
+
+@receiver(post_save, sender=Book)
+def update_category_counters(sender, instance, created, **kwargs):
+    category, available = instance.category, instance.copies_available
+    if created:
+        Category.adjust(category, books=1, copies=available)
+    else:
+        # Fields that were deferred when the book was loaded cannot have changed.
+        old_category, old_available = instance._category_state
+        old_category = category if old_category is None else old_category
+        old_available = available if old_available is None else old_available
+        if old_category != category:
+            Category.adjust(old_category, books=-1, copies=-old_available)
+            Category.adjust(category, books=1, copies=available)
+        elif old_available != available:
+            Category.adjust(category, copies=available - old_available)
+    instance._category_state = (category, available)
+
+
+@receiver(pre_delete, sender=Book)
+def remove_from_category_counters(sender, instance, **kwargs):
+    Category.adjust(instance.category, books=-1, copies=-instance.copies_available)
+
+
+@receiver(post_save, sender=Book)
+def sync_book_copies(sender, instance, created, **kwargs):
+    copies_total = instance.__dict__.get('copies_total')
+    if created or copies_total not in (None, instance._copies_total):
+        # Set first: sync_copies() saves the book again.
+        instance._copies_total = copies_total
+        instance.sync_copies(initial=created)
+        # Folding adjusted the category counters already.
+        instance._category_state = (instance.category, instance.copies_available)
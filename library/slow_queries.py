@@ -0,0 +1,131 @@
+"""
+Slow-query log.
+
+SlowQueryLogMiddleware wraps the database connection for the duration of a
+request and remembers every statement slower than SLOW_QUERY_THRESHOLD_MS.
+Once the response is ready the statements are handed to a background worker
+that runs EXPLAIN on its own connection and stores the result in the capped
+SlowQuery table, so the request itself never waits on the plan capture.
+"""
+import hashlib
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection, connections
+
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+|\'[^\']*\')\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?([\w.]+)"?', re.IGNORECASE)
+
+MAX_PENDING = 100
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-log')
+_pending = 0
+_pending_lock = Lock()
+
+
+def normalize_sql(sql):
+    """Collapse literals, IN lists and whitespace so equivalent statements compare equal."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode('utf-8')).hexdigest()
+
+
+def main_table(sql):
+    match = _TABLE_RE.search(sql)
+    return match.group(1) if match else ''
+
+
+def explain(sql, params, using='default'):
+    """Return the plan of a SELECT statement, or '' for anything else."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    db = connections[using]
+    prefix = 'EXPLAIN QUERY PLAN ' if db.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+
+
+def record_slow_queries(view_name, statements, using='default'):
+    """Store a request's slow statements with their plans, then trim the table to its cap."""
+    from .models import SlowQuery
+
+    entries = []
+    for sql, params, duration_ms in statements:
+        normalized = normalize_sql(sql)
+        entries.append(SlowQuery(
+            view_name=view_name,
+            fingerprint=fingerprint(normalized),
+            table_name=main_table(sql),
+            normalized_sql=normalized,
+            duration_ms=duration_ms,
+            explain=explain(sql, params, using),
+        ))
+    SlowQuery.objects.using(using).bulk_create(entries)
+
+    max_rows = getattr(settings, 'SLOW_QUERY_LOG_MAX_ROWS', 1000)
+    cutoff = list(SlowQuery.objects.using(using).order_by('-id')
+                  .values_list('id', flat=True)[max_rows:max_rows + 1])
+    if cutoff:
+        SlowQuery.objects.using(using).filter(id__lte=cutoff[0]).delete()
+
+
+def _record_in_background(view_name, statements):
+    global _pending
+    try:
+        record_slow_queries(view_name, statements)
+    except Exception:
+        logger.exception('Could not record slow queries for %s', view_name)
+    finally:
+        connection.close()
+        with _pending_lock:
+            _pending -= 1
+
+
+def submit(view_name, statements):
+    """Queue statements for plan capture; drop them if the worker is backed up."""
+    global _pending
+    if not getattr(settings, 'SLOW_QUERY_LOG_ASYNC', True):
+        record_slow_queries(view_name, statements)
+        return
+    with _pending_lock:
+        if _pending >= MAX_PENDING:
+            return
+        _pending += 1
+    _executor.submit(_record_in_background, view_name, statements)
+
+
+class SlowQueryCollector:
+    """connection.execute_wrapper() hook collecting statements over the threshold."""
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (perf_counter() - start) * 1000
+            if duration_ms >= self.threshold_ms and not many:
+                self.statements.append((sql, params, duration_ms))
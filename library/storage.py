@@ -0,0 +1,42 @@
+"""
+Content-addressed media storage.
+
+Uploads are stored as <upload_to>/<sha256 of the bytes><ext>, so identical
+files (the same publisher cover uploaded for several books, a photo uploaded
+twice) share one file on disk, and a URL never changes meaning once issued.
+That is what lets the media view mark these files immutable.
+
+Renditions are already named after their (hashed) source, so anything under
+renditions/ is written under the name it was given.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+from .renditions import RENDITION_DIR
+
+
+HASHED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{64}(?:\.\d+w)?\.\w+$')
+
+
+def is_content_addressed(name):
+    return bool(HASHED_NAME_RE.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        if name.startswith(f'{RENDITION_DIR}/'):
+            return super()._save(name, content)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        directory, filename = os.path.split(name)
+        hashed_name = os.path.join(directory, digest.hexdigest() + os.path.splitext(filename)[1].lower())
+        if self.exists(hashed_name):
+            return hashed_name
+        return super()._save(hashed_name, content)
@@ -0,0 +1,36 @@
+from django import template
+
+from .. import renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition_url(image, width, ext='jpg'):
+    """URL of the rendition closest to `width`, falling back to the original upload."""
+    if not renditions.ensure(image):
+        return image.url if image else ''
+    width = min(renditions.widths(), key=lambda candidate: (candidate < width, abs(candidate - width)))
+    return renditions.rendition_url(image, width, ext)
+
+
+@register.simple_tag
+def srcset(image, ext='jpg'):
+    """`srcset` value listing every rendition of `image`, or '' if there are none."""
+    if not renditions.ensure(image):
+        return ''
+    return renditions.srcset(image, ext)
+
+
+@register.inclusion_tag('library/includes/picture.html')
+def picture(image, width, alt='', css='', sizes=''):
+    """<picture> with WebP and JPEG renditions of `image` for a slot `width` CSS pixels wide."""
+    ready = renditions.ensure(image)
+    return {
+        'src': rendition_url(image, width * 2),
+        'webp_srcset': renditions.srcset(image, 'webp') if ready else '',
+        'jpeg_srcset': renditions.srcset(image, 'jpg') if ready else '',
+        'sizes': sizes or f'{width}px',
+        'alt': alt,
+        'css': css,
+    }
@@ -1,3 +1,1130 @@
-from django.test import TestCase
+import gzip
+import os
+import pstats
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .metrics import registry
+from .forms import BookForm
+from .isbn import canonical_isbn
+from .media import serve_media
+from .models import (User, Student, Book, BookCopy, BookRecommendation, Category, CirculationDaily, Hold, InventoryEvent, PosToken, ArchivedTransaction, Transaction, TransactionItem, Librarian, SystemSettings, AdminLog,
+                     SlowQuery, ProfileCapture)
+from . import renditions
+from .profiling import make_token
+from .recommendations import borrower_counts
+from .slow_queries import normalize_sql
+
+
+# Maximum number of queries each page may issue, keyed on URL name.
+# The value is (user_type of the requesting user, budget). A view must stay
+# within its budget AND issue the same number of queries whether the
+# database holds a handful of rows or many times more.
+QUERY_BUDGETS = {
+    'admin_dashboard': ('admin', 12),
+    'librarian_dashboard': ('librarian', 12),
+    'student_dashboard': ('student', 15),
+    'student_books': ('student', 8),
+    'student_settings': ('student', 4),
+    'manage_books': ('admin', 8),
+    'manage_students': ('admin', 6),
+    'pending_students': ('admin', 4),
+    'pending_transactions': ('admin', 6),
+    'manage_librarians': ('admin', 4),
+    'admin_logs': ('admin', 6),
+    'admin_settings': ('admin', 4),
+    'admin_metrics': ('admin', 3),
+    'admin_analytics': ('admin', 10),
+    'admin_slow_queries': ('admin', 6),
+    'admin_profiles': ('admin', 4),
+    'export_books_by_category': ('admin', 3),
+    'pos_home': ('pos', 3),
+    'pos_borrow_book': ('pos', 3),
+    'pos_return_book': ('pos', 3),
+    'admin:library_book_changelist': ('admin', 9),
+    'admin:library_transaction_changelist': ('admin', 9),
+    'admin:library_transactionitem_changelist': ('admin', 9),
+}
+
+
+class QueryBudgetTests(TestCase):
+    SMALL = 2
+    LARGE = 8
+
+    def setUp(self):
+        self.users = {
+            'admin': User.objects.create_superuser('qb_admin', 'pass'),
+            'librarian': User.objects.create_user('qb_librarian', 'pass', user_type='librarian'),
+            'pos': User.objects.create_user('qb_pos', 'pass', user_type='pos'),
+            'student': User.objects.create_user('qb_student', 'pass', user_type='student'),
+        }
+        Librarian.objects.create(user=self.users['librarian'], name='QB Librarian', email='qb@example.com')
+        self.student = Student.objects.create(
+            user=self.users['student'], student_id='QB-0000', last_name='Budget',
+            first_name='Query', course='BSIT', year='1', section='A', is_approved=True
+        )
+        self.seeded = 0
+        # Created lazily by the context processor on first render.
+        SystemSettings.get_settings()
+
+    def seed(self, size):
+        """Grow every table the budgeted pages read until it holds `size` rows per kind."""
+        now = timezone.now()
+        for n in range(self.seeded, size):
+            book = Book.objects.create(
+                isbn=f'978000000{n:04d}', title=f'Book {n}', author=f'Author {n}',
+                category=f'Category {n % 3}', copies_total=3, copies_available=3
+            )
+            other_book = Book.objects.create(
+                isbn=f'978100000{n:04d}', title=f'Other Book {n}', author=f'Author {n}',
+                category=f'Category {n % 3}', copies_total=3, copies_available=3
+            )
+            user = User.objects.create_user(f'qb_user_{n}', 'pass', user_type='student', is_active=False)
+            student = Student.objects.create(
+                user=user, student_id=f'QB-{n + 1:04d}', last_name=f'Last {n}',
+                first_name=f'First {n}', course='BSIT', year='2', section='B',
+                is_approved=(n % 2 == 0)
+            )
+            for owner, approval, status in (
+                (self.student, 'approved', 'borrowed'),
+                (self.student, 'approved', 'returned'),
+                (student, 'approved', 'borrowed'),
+                (student, 'pending', 'borrowed'),
+            ):
+                transaction = Transaction.objects.create(
+                    transaction_code=f'QB{n:04d}{owner.pk}{approval[0]}{status[0]}',
+                    student=owner, due_date=now + timedelta(days=7), status=status,
+                    approval_status=approval, created_by=self.users['pos']
+                )
+                TransactionItem.objects.create(transaction=transaction, book=book, status=status)
+                TransactionItem.objects.create(transaction=transaction, book=other_book, status=status)
+            Hold.objects.create(book=book, student=self.student)
+            librarian_user = User.objects.create_user(f'qb_librarian_{n}', 'pass', user_type='librarian')
+            Librarian.objects.create(user=librarian_user, name=f'Librarian {n}', email=f'lib{n}@example.com')
+            AdminLog.objects.create(librarian=librarian_user, action='book_add', description=f'Added Book {n}')
+        self.seeded = size
+
+    def count_queries(self, url_name, user_type):
+        self.client.force_login(self.users[user_type])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200, f'{url_name} returned {response.status_code}')
+        return len(context.captured_queries)
+
+    def test_query_counts_are_constant_and_within_budget(self):
+        counts = {}
+        for size in (self.SMALL, self.LARGE):
+            self.seed(size)
+            for url_name, (user_type, budget) in QUERY_BUDGETS.items():
+                counts.setdefault(url_name, []).append(self.count_queries(url_name, user_type))
+
+        for url_name, (user_type, budget) in QUERY_BUDGETS.items():
+            small, large = counts[url_name]
+            with self.subTest(url_name=url_name):
+                self.assertEqual(
+                    small, large,
+                    f'{url_name} issued {small} queries with {self.SMALL} rows but {large} with {self.LARGE} (N+1)'
+                )
+                self.assertLessEqual(large, budget, f'{url_name} issued {large} queries, budget is {budget}')
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('metrics_admin', 'pass')
+        registry.reset()
+
+    def test_request_is_recorded_per_view(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('admin_dashboard'))
+        rows = {row['view']: row for row in registry.snapshot()}
+        self.assertEqual(rows['admin_dashboard']['requests'], 1)
+        self.assertGreater(rows['admin_dashboard']['queries_mean'], 0)
+        self.assertGreater(rows['admin_dashboard']['render_mean_ms'], 0)
+
+    def test_prometheus_endpoint_requires_admin_or_token(self):
+        self.assertEqual(self.client.get(reverse('metrics_export')).status_code, 403)
+
+        self.client.force_login(self.admin)
+        self.client.get(reverse('admin_dashboard'))
+        response = self.client.get(reverse('metrics_export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('library_request_queries_count{view="admin_dashboard"} 1', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_prometheus_endpoint_accepts_bearer_token(self):
+        response = self.client.get(reverse('metrics_export'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryLogTests(TestCase):
+    def test_normalize_sql_collapses_literals(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM book WHERE id IN (%s, %s, %s) AND title = 'x'  LIMIT 21"),
+            'SELECT * FROM book WHERE id IN (...) AND title = ? LIMIT ?'
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0.001, SLOW_QUERY_LOG_ASYNC=False, SLOW_QUERY_LOG_MAX_ROWS=5)
+    def test_slow_statements_are_logged_with_plan_and_capped(self):
+        self.client.force_login(User.objects.create_superuser('slow_admin', 'pass'))
+        self.client.get(reverse('manage_books'))
+
+        logged = SlowQuery.objects.all()
+        self.assertEqual(logged.count(), 5)
+        book_query = logged.filter(table_name='library_book').first()
+        self.assertIsNotNone(book_query)
+        self.assertEqual(book_query.view_name, 'manage_books')
+        self.assertNotEqual(book_query.explain, '')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('profile_admin', 'pass')
+        student_user = User.objects.create_user('profile_student', 'pass', user_type='student')
+        Student.objects.create(
+            user=student_user, student_id='PR-0001', last_name='Profile', first_name='Student',
+            course='BSIT', year='1', section='A', is_approved=True
+        )
+        self.student_user = student_user
+
+    def test_signed_parameter_profiles_a_single_request(self):
+        token = make_token(self.admin)
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('student_books'), {'profile': token, 'category': 'Fiction'})
+
+        capture = ProfileCapture.objects.get()
+        self.assertEqual(response['X-Profile-Id'], str(capture.id))
+        self.assertEqual(capture.view_name, 'student_books')
+        self.assertEqual(capture.path, '/student/books/?category=Fiction')
+        self.assertEqual(capture.issued_by, self.admin)
+        # The token is spent: replaying it runs the page without profiling.
+        self.client.get(reverse('student_books'), {'profile': token})
+        self.assertEqual(ProfileCapture.objects.count(), 1)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('admin_profile_detail', args=[capture.id])).status_code, 200)
+        download = self.client.get(reverse('admin_profile_download', args=[capture.id]))
+        with tempfile.NamedTemporaryFile(suffix='.prof') as prof:
+            prof.write(download.content)
+            prof.flush()
+            self.assertGreater(pstats.Stats(prof.name).total_calls, 0)
+
+    def test_invalid_token_is_ignored(self):
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('student_books'), {'profile': 'forged'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    def test_anonymous_requests_are_not_profiled(self):
+        token = make_token(self.admin)
+        self.client.get(reverse('login'), {'profile': token})
+        self.assertFalse(ProfileCapture.objects.exists())
+        # Ignoring the token does not spend it.
+        self.client.force_login(self.student_user)
+        self.client.get(reverse('student_books'), {'profile': token})
+        self.assertTrue(ProfileCapture.objects.exists())
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, UPLOAD_IMAGE_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        renditions._known.clear()
+
+        student_user = User.objects.create_user('rendition_student', 'pass', user_type='student')
+        Student.objects.create(
+            user=student_user, student_id='RN-0001', last_name='Rendition', first_name='Student',
+            course='BSIT', year='1', section='A', is_approved=True
+        )
+        self.client.force_login(student_user)
+
+    def cover(self, name='cover.png'):
+        buffer = BytesIO()
+        Image.new('RGBA', (1200, 1600), (200, 40, 40, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_renditions_are_generated_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(isbn='9780000000001', title='Covered', author='A', category='Fiction',
+                                       book_cover=self.cover())
+        book.refresh_from_db()
+        for ext in renditions.FORMATS:
+            for width in renditions.widths():
+                name = renditions.rendition_name(book.book_cover.name, width, ext)
+                with default_storage.open(name) as rendition:
+                    self.assertLessEqual(Image.open(rendition).width, width)
+
+        html = self.client.get(reverse('student_books')).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(renditions.rendition_url(book.book_cover, 640, 'webp') + ' 640w', html)
+        self.assertNotIn(f'src="{book.book_cover.url}"', html)
+
+    def test_missing_renditions_are_generated_lazily(self):
+        name = default_storage.save('book_covers/legacy.png', self.cover())
+        Book.objects.create(isbn='9780000000002', title='Legacy', author='A', category='Fiction')
+        Book.objects.filter(isbn='9780000000002').update(book_cover=name)
+        marker = renditions.rendition_name(name, renditions.widths()[-1], 'jpg')
+        self.assertFalse(default_storage.exists(marker))
+
+        self.assertEqual(self.client.get(reverse('student_books')).status_code, 200)
+        self.assertTrue(default_storage.exists(marker))
+
+    def test_unreadable_upload_falls_back_to_original(self):
+        name = default_storage.save('book_covers/broken.jpg', SimpleUploadedFile('broken.jpg', b'not an image'))
+        Book.objects.create(isbn='9780000000003', title='Broken', author='A', category='Fiction')
+        Book.objects.filter(isbn='9780000000003').update(book_cover=name)
+
+        with self.assertLogs('library.renditions', 'WARNING'):
+            html = self.client.get(reverse('student_books')).content.decode()
+        self.assertIn(f'src="{default_storage.url(name)}"', html)
+        self.assertFalse(os.path.exists(os.path.join(default_storage.location, renditions.RENDITION_DIR, 'book_covers')))
+
+
+@override_settings(UPLOAD_IMAGE_ASYNC=False, UPLOAD_IMAGE_MAX_DIMENSION=800)
+class UploadNormalizationTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def photo(self, size, orientation=None):
+        image = Image.new('RGB', size, (30, 90, 160))
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=100, exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def book_form(self, cover):
+        data = {'isbn': '9780000000010', 'title': 'Photo', 'author': 'A', 'category': 'Fiction', 'copies_total': 1}
+        return BookForm(data, {'book_cover': cover})
+
+    @override_settings(UPLOAD_IMAGE_MAX_PIXELS=10_000)
+    def test_form_rejects_oversized_images(self):
+        form = self.book_form(self.photo((200, 100)))
+        self.assertFalse(form.is_valid())
+        self.assertIn('too large', form.errors['book_cover'][0])
+
+    def test_upload_is_resized_rotated_and_stripped(self):
+        form = self.book_form(self.photo((2000, 1000), orientation=6))
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            book = form.save()
+        original = book.book_cover.name
+
+        book.refresh_from_db()
+        self.assertNotEqual(book.book_cover.name, original)
+        self.assertFalse(default_storage.exists(original))
+        with default_storage.open(book.book_cover.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (400, 800))
+            self.assertFalse(image.getexif())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, UPLOAD_IMAGE_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_identical_uploads_share_one_file(self):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 400), (10, 120, 60)).save(buffer, 'JPEG')
+        books = []
+        for number in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                books.append(Book.objects.create(
+                    isbn=f'978000000002{number}', title=f'Shared {number}', author='A', category='Fiction',
+                    book_cover=SimpleUploadedFile(f'upload-{number}.jpg', buffer.getvalue())
+                ))
+        for book in books:
+            book.refresh_from_db()
+
+        self.assertEqual(books[0].book_cover.name, books[1].book_cover.name)
+        self.assertRegex(books[0].book_cover.name, r'^book_covers/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(os.listdir(os.path.join(default_storage.location, 'book_covers')),
+                         [os.path.basename(books[0].book_cover.name)])
+
+    def test_hashed_files_are_served_as_immutable(self):
+        hashed = default_storage.save('book_covers/cover.jpg', SimpleUploadedFile('cover.jpg', b'cover'))
+        legacy = 'book_covers/legacy.jpg'
+        with open(os.path.join(default_storage.location, legacy), 'wb') as f:
+            f.write(b'legacy')
+
+        request = RequestFactory().get('/media/' + hashed)
+        self.assertIn('immutable', serve_media(request, hashed)['Cache-Control'])
+        self.assertIn('must-revalidate', serve_media(request, legacy)['Cache-Control'])
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.name = default_storage.save('book_covers/cover.jpg', SimpleUploadedFile('cover.jpg', bytes(range(200))))
+        self.url = '/media/' + self.name
+
+    def test_etag_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(200)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, bytes(range(10, 20)))
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/200')
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=-5').content, bytes(range(195, 200)))
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE='bytes=500-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */200')
+
+    def test_precompressed_variant_is_preferred(self):
+        path = os.path.join(default_storage.location, 'system', 'logo.svg')
+        os.makedirs(os.path.dirname(path))
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg">' + b'<g/>' * 500 + b'</svg>'
+        with open(path, 'wb') as f:
+            f.write(svg)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(svg))
+
+        response = self.client.get('/media/system/logo.svg', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), svg)
+        self.assertNotIn('Content-Encoding', self.client.get('/media/system/logo.svg'))
+
+    def test_paths_outside_media_root_are_refused(self):
+        self.assertIn(self.client.get('/media/../manage.py').status_code, (400, 404))
+
+
+class ConditionalCatalogTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(isbn='9780000000100', title='Versioned', author='A', category='Fiction')
+        self.students = []
+        for number in range(2):
+            user = User.objects.create_user(f'etag_student_{number}', 'pass', user_type='student')
+            Student.objects.create(
+                user=user, student_id=f'ET-000{number}', last_name='Etag', first_name='Student',
+                course='BSIT', year='1', section='A', is_approved=True
+            )
+            self.students.append(user)
+        self.client.force_login(self.students[0])
+
+    def test_unchanged_catalog_returns_not_modified(self):
+        url = reverse('student_books')
+        first = self.client.get(url, {'category': 'Fiction'})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url, {'category': 'Fiction'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse(any('DISTINCT' in query['sql'] for query in queries.captured_queries))
+
+        self.assertEqual(self.client.get(url, {'category': 'Other'}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.client.force_login(self.students[1])
+        self.assertEqual(self.client.get(url, {'category': 'Fiction'}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_book_change_invalidates_etag(self):
+        url = reverse('student_books')
+        etag = self.client.get(url)['ETag']
+        self.book.copies_available = 0
+        self.book.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Book.objects.create(isbn='9780000000101', title='Another', author='A', category='Fiction')
+        etag = self.client.get(url)['ETag']
+        Book.objects.filter(isbn='9780000000101').delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        for number, category in enumerate(['Fiction', 'Fiction', 'History']):
+            Book.objects.create(isbn=f'978000000030{number}', title=f'Cached {number}', author='A', category=category)
+        user = User.objects.create_user('cache_student', 'pass', user_type='student')
+        Student.objects.create(
+            user=user, student_id='CC-0001', last_name='Cache', first_name='Student',
+            course='BSIT', year='1', section='A', is_approved=True
+        )
+        self.client.force_login(user)
+
+    def titles(self, **params):
+        response = self.client.get(reverse('student_books'), params)
+        return [book.title for book in response.context['books']]
+
+    def test_repeat_visits_skip_count_and_distinct(self):
+        self.assertEqual(self.titles(category='Fiction'), ['Cached 0', 'Cached 1'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.titles(category='Fiction'), ['Cached 0', 'Cached 1'])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT(*)', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertEqual(registry.counters(), {'catalog_cache_hits': 1, 'catalog_cache_misses': 1})
+
+    def test_invalidation_is_limited_to_affected_categories(self):
+        self.titles(category='Fiction')
+        self.titles(category='History')
+
+        book = Book.objects.get(title='Cached 0')
+        book.copies_available = 0
+        book.save()
+        self.titles(category='Fiction')
+        self.assertEqual(registry.counters()['catalog_cache_hits'], 1)
+
+        Book.objects.create(isbn='9780000000310', title='Cached 3', author='A', category='Fiction')
+        self.assertEqual(self.titles(category='Fiction'), ['Cached 0', 'Cached 1', 'Cached 3'])
+        self.titles(category='History')
+        self.assertEqual(registry.counters(), {'catalog_cache_hits': 2, 'catalog_cache_misses': 3})
+
+        book.category = 'History'
+        book.save()
+        self.assertEqual(self.titles(category='History'), ['Cached 0', 'Cached 2'])
+        self.assertEqual(self.titles(category='Fiction'), ['Cached 1', 'Cached 3'])
+
+
+class CategoryCounterTests(TestCase):
+    def counters(self):
+        return {category.name: (category.book_count, category.available_copies) for category in Category.objects.all()}
+
+    def test_counters_follow_book_changes(self):
+        first = Book.objects.create(isbn='9780000000400', title='One', author='A', category='Fiction',
+                                    copies_total=3, copies_available=3)
+        Book.objects.create(isbn='9780000000401', title='Two', author='A', category='Fiction',
+                            copies_total=2, copies_available=2)
+        self.assertEqual(self.counters(), {'Fiction': (2, 5)})
+
+        first.copies_available -= 1
+        first.save()
+        self.assertEqual(self.counters(), {'Fiction': (2, 4)})
+
+        first.category = 'History'
+        first.save()
+        self.assertEqual(self.counters(), {'Fiction': (1, 2), 'History': (1, 2)})
+
+        Book.objects.only('id', 'copies_available').get(pk=first.pk).delete()
+        self.assertEqual(self.counters(), {'Fiction': (1, 2), 'History': (0, 0)})
+
+    def test_rebuild_repairs_bulk_changes(self):
+        Book.objects.create(isbn='9780000000402', title='Three', author='A', category='Science',
+                            copies_total=4, copies_available=4)
+        Book.objects.update(copies_available=1)
+        Book.objects.create(isbn='9780000000404', title='Uncategorised', author='A', category='')
+        Category.rebuild()
+        self.assertEqual(self.counters(), {'Science': (1, 1)})
+
+    def test_export_is_limited_to_known_categories(self):
+        admin = User.objects.create_superuser('category_admin', 'pass')
+        book = Book.objects.create(isbn='9780000000403', title='Four', author='A', category='Science',
+                                   copies_total=2, copies_available=2)
+        # An unfolded borrow counts against the stored snapshot.
+        InventoryEvent.record(book.copies.all()[:1], 'borrow')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('export_books_by_category'), {'category': 'Science'})
+        self.assertIn(b'9780000000403', response.content)
+        self.assertEqual(response.content.decode().splitlines()[1].split(',')[-2:], ['2', '1'])
+        response = self.client.get(reverse('admin:library_book_changelist'))
+        self.assertContains(response, '<td class="field-get_availability">1</td>', html=True)
+        self.assertEqual(self.client.get(reverse('export_books_by_category'), {'category': 'Nope'}).status_code, 404)
+
+
+class ISBNTests(TestCase):
+    def test_canonical_isbn(self):
+        self.assertEqual(canonical_isbn('978-0-306-40615-7'), '9780306406157')
+        self.assertEqual(canonical_isbn('0-306-40615-2'), '9780306406157')
+        self.assertEqual(canonical_isbn(' 080442957x '), '9780804429573')
+        # Not a valid ISBN-10: only compacted.
+        self.assertEqual(canonical_isbn('0-306-40615-3'), '0306406153')
+        self.assertIsNone(canonical_isbn(''))
+
+    def test_lookups_and_duplicates_ignore_formatting(self):
+        book = Book.objects.create(isbn='978-0-306-40615-7', title='Measurement', author='A', category='Science')
+        self.assertEqual(book.isbn13, '9780306406157')
+        self.assertEqual(Book.objects.get_by_isbn('0306406152'), book)
+
+        form = BookForm({'isbn': '0-306-40615-2', 'title': 'Copy', 'author': 'A', 'category': 'Science',
+                         'copies_total': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('isbn', form.errors)
+
+        pos = User.objects.create_user('isbn_pos', 'pass', user_type='pos')
+        Student.objects.create(student_id='IS-0001', last_name='Isbn', first_name='Student',
+                               course='BSIT', year='1', section='A', is_approved=True)
+        self.client.force_login(pos)
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'IS-0001'})
+        self.client.post(reverse('pos_borrow_book'), {'isbn': '0306406152'})
+        self.assertEqual([entry['id'] for entry in self.client.session['pos_books']], [book.id])
+
+
+class BookCopyTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(isbn='9780000000501', title='Copies', author='A', category='Science',
+                                        copies_total=2, copies_available=2)
+        Student.objects.create(student_id='BC-0001', last_name='Copy', first_name='Student',
+                               course='BSIT', year='1', section='A', is_approved=True)
+
+    def test_copies_follow_copies_total(self):
+        self.assertEqual(list(self.book.copies.values_list('barcode', flat=True)),
+                         [BookCopy.make_barcode(self.book.id, 1), BookCopy.make_barcode(self.book.id, 2)])
+        self.book.copies_total = 3
+        self.book.save()
+        self.assertEqual(self.book.copies.filter(status='available').count(), 3)
+        self.book.copies_total = 1
+        self.book.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+        self.assertEqual(self.book.copies.filter(status='withdrawn').count(), 2)
+        self.assertEqual(Category.objects.get(name='Science').available_copies, 1)
+
+    def test_borrow_and_return_by_copy_barcode(self):
+        barcode = BookCopy.make_barcode(self.book.id, 2)
+        self.client.force_login(User.objects.create_user('copy_pos', 'pass', user_type='pos'))
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'BC-0001'})
+        self.client.post(reverse('pos_borrow_book'), {'isbn': barcode, 'add_another': ''})
+        # The same copy cannot go into the cart twice.
+        self.client.post(reverse('pos_borrow_book'), {'isbn': barcode, 'add_another': ''})
+        self.assertEqual([entry['barcode'] for entry in self.client.session['pos_books']], [barcode])
+        self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': ''})
+        call_command('compact_inventory', stdout=StringIO())
+        self.assertEqual(Category.objects.get(name='Science').available_copies, 1)
+
+        copy = BookCopy.objects.get(barcode=barcode)
+        self.assertEqual(copy.status, 'pending')
+        self.assertEqual(copy.current_item.copy, copy)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 1)
+
+        self.client.force_login(User.objects.create_user('copy_admin', 'pass', user_type='admin'))
+        self.client.post(reverse('approve_transaction', args=[copy.current_item.transaction_id]))
+        copy.refresh_from_db()
+        self.assertEqual(copy.status, 'borrowed')
+
+        self.client.force_login(User.objects.get(username='copy_pos'))
+        response = self.client.post(reverse('pos_return_book'), {'transaction_code': barcode})
+        self.assertEqual(response.context['scanned_item'], copy.current_item)
+        self.client.post(reverse('pos_return_book'), {
+            'return_books': '', 'transaction_code_value': copy.current_item.transaction.transaction_code,
+            'selected_books': [copy.current_item_id],
+        })
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.current_item), ('available', None))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 2)
+
+        # The return only appended to the ledger; compaction folds it into the book.
+        self.assertEqual(self.book.copies_available, 1)
+        self.assertEqual(list(InventoryEvent.objects.order_by('id').values_list('kind', 'delta', 'folded')),
+                         [('borrow', -1, True), ('return', 1, False)])
+        call_command('compact_inventory', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 2)
+        self.assertEqual(Book.objects.with_availability().get(pk=self.book.pk).availability, 2)
+
+    def test_next_available_follows_loans(self):
+        pos = User.objects.create_user('next_pos', 'pass', user_type='pos')
+        admin = User.objects.create_user('next_admin', 'pass', user_type='admin')
+        Student.objects.create(student_id='BC-0002', last_name='Copy', first_name='Other',
+                               course='BSIT', year='1', section='A', is_approved=True)
+        self.client.force_login(pos)
+        for student_id in ['BC-0001', 'BC-0002']:
+            self.client.post(reverse('pos_borrow_book'), {'student_id': student_id})
+            self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn})
+            self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': ''})
+        first, second = Transaction.objects.order_by('due_date')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.next_available_at, first.due_date)
+
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'BC-0001'})
+        response = self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn}, follow=True)
+        expected = timezone.localtime(first.due_date).strftime('%b %d, %Y')
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         [f'Book is not available (next copy expected back {expected})'])
+
+        # Ending a loan due after the next expected copy leaves the book row alone.
+        self.client.force_login(admin)
+        updated_at = self.book.updated_at
+        self.client.post(reverse('reject_transaction', args=[second.id]))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.next_available_at, self.book.updated_at), (first.due_date, updated_at))
+        self.client.post(reverse('reject_transaction', args=[first.id]))
+        self.book.refresh_from_db()
+        self.assertIsNone(self.book.next_available_at)
+        self.assertGreater(self.book.updated_at, updated_at)
+
+    def test_resubmitted_confirm_returns_the_original_transaction(self):
+        self.client.force_login(User.objects.create_user('retry_pos', 'pass', user_type='pos'))
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'BC-0001'})
+        response = self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn})
+        key = response.context['idempotency_key']
+        first = self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': '', 'idempotency_key': key})
+        retry = self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': '', 'idempotency_key': key})
+        self.assertEqual(retry.context['transaction'], first.context['transaction'])
+        code = first.context['transaction'].transaction_code
+        self.assertEqual([str(message) for message in first.context['messages']], [])
+        self.assertEqual([str(message) for message in retry.context['messages']],
+                         [f'Checkout {code} was already recorded'])
+        self.assertEqual((Transaction.objects.count(), TransactionItem.objects.count()), (1, 1))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).availability, 1)
+
+    def test_batch_scan_resolves_every_code_in_one_request(self):
+        other = Book.objects.create(isbn='9780000000502', title='Other', author='A', category='Science')
+        self.client.force_login(User.objects.create_user('batch_pos', 'pass', user_type='pos'))
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'BC-0001'})
+        with CaptureQueriesContext(connection) as single:
+            self.client.post(reverse('pos_borrow_book'), {'isbn': other.isbn, 'add_another': ''})
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'BC-0001'})
+        barcode = BookCopy.make_barcode(self.book.id, 2)
+        scan = f'{barcode}\n{self.book.isbn}, {self.book.isbn}\n{other.isbn} 9789999999999'
+        with CaptureQueriesContext(connection) as batch:
+            response = self.client.post(reverse('pos_borrow_book'), {'isbn': scan})
+        self.assertEqual(len(batch.captured_queries), len(single.captured_queries))
+        self.assertEqual([result['status'] for result in response.context['scan_results']],
+                         ['added', 'added', 'unavailable', 'added', 'not_found'])
+        self.assertEqual([entry['barcode'] for entry in self.client.session['pos_books']],
+                         [barcode, BookCopy.make_barcode(self.book.id, 1), BookCopy.make_barcode(other.id, 1)])
+        self.assertEqual(response.context['step'], 'add_books')
+
+
+class ReconcileInventoryTests(TestCase):
+    def test_reports_and_fixes_drift(self):
+        book = Book.objects.create(isbn='9780000000601', title='Drift', author='A', category='Science',
+                                   copies_total=3, copies_available=3)
+        Book.objects.create(isbn='9780000000602', title='Steady', author='A', category='Science',
+                            copies_total=1, copies_available=1)
+        Book.objects.filter(pk=book.pk).update(copies_available=7)
+
+        out = StringIO()
+        call_command('reconcile_inventory', stdout=out)
+        self.assertIn('available=7, on shelf=3', out.getvalue())
+        self.assertIn('1 drifted', out.getvalue())
+        self.assertEqual(Book.objects.get(pk=book.pk).copies_available, 7)
+
+        with self.assertNumQueries(1):
+            call_command('reconcile_inventory', stdout=StringIO())
+        call_command('reconcile_inventory', '--fix', stdout=StringIO())
+        self.assertEqual(Book.objects.get(pk=book.pk).copies_available, 3)
+        self.assertEqual(Category.objects.get(name='Science').available_copies, 4)
+
+    def test_fix_repairs_drift_on_books_whose_copies_are_synced(self):
+        book = Book.objects.create(isbn='9780000000603', title='Grown', author='A', category='Science',
+                                   copies_total=3, copies_available=3)
+        Book.objects.filter(pk=book.pk).update(copies_total=4, copies_available=9)
+        call_command('reconcile_inventory', '--fix', stdout=StringIO())
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual(book.copies.filter(status='available').count(), 4)
+        self.assertEqual(book.availability, 4)
+
+
+class TransactionArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('archive_student', 'pass', user_type='student')
+        self.student = Student.objects.create(user=self.user, student_id='AR-0001', last_name='Archive',
+                                              first_name='Student', course='BSIT', year='1', section='A',
+                                              is_approved=True)
+        self.book = Book.objects.create(isbn='9780000000701', title='Archived', author='A', category='Science')
+        long_ago = timezone.now() - timedelta(days=90)
+        self.old = Transaction.objects.create(transaction_code='ARCHIVE-OLD', student=self.student, due_date=long_ago,
+                                              borrowed_date=long_ago, return_date=long_ago, status='returned',
+                                              approval_status='approved')
+        TransactionItem.objects.create(transaction=self.old, book=self.book, borrowed_date=long_ago,
+                                       return_date=long_ago, status='returned')
+        self.open = Transaction.objects.create(transaction_code='ARCHIVE-OPEN', student=self.student,
+                                               due_date=timezone.now(), approval_status='approved')
+
+    def test_moves_closed_transactions_and_keeps_history(self):
+        copy = self.book.copies.get()
+        copy.current_item = self.old.items.get()
+        InventoryEvent.record([copy], 'borrow')
+        call_command('archive_transactions', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(list(Transaction.objects.values_list('transaction_code', flat=True)), ['ARCHIVE-OPEN'])
+        archived = ArchivedTransaction.objects.get()
+        self.assertEqual((archived.id, archived.transaction_code), (self.old.id, 'ARCHIVE-OLD'))
+        self.assertEqual(archived.get_book_titles(), 'Archived')
+        self.assertFalse(TransactionItem.objects.filter(transaction_id=self.old.id).exists())
+        # The ledger still points at the item, now in the archive.
+        event = InventoryEvent.objects.get()
+        self.assertEqual(archived.items.get().id, event.item_id_snapshot)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual([entry.transaction_code for entry in response.context['history']],
+                         ['ARCHIVE-OPEN', 'ARCHIVE-OLD'])
+        self.assertEqual(response.context['returned_count'], 1)
+
+
+    def test_str_counts_items_without_loading_them(self):
+        loan = Transaction.objects.select_related('student').get(pk=self.old.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(str(loan), 'ARCHIVE-OLD - AR-0001 - 1 book(s)')
+        self.assertIn('COUNT(', queries[0]['sql'])
+        loan = Transaction.objects.select_related('student').prefetch_related('items').get(pk=self.old.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(loan), 'ARCHIVE-OLD - AR-0001 - 1 book(s)')
+
+
+class CirculationRollupTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(isbn='9780000000801', title='Rolled Up', author='A', category='Science',
+                                        copies_total=2, copies_available=2)
+        Student.objects.create(student_id='CR-0001', last_name='Roll', first_name='Up',
+                               course='BSCS', year='1', section='A', is_approved=True)
+        self.pos = User.objects.create_user('rollup_pos', 'pass', user_type='pos')
+        self.admin = User.objects.create_user('rollup_admin', 'pass', user_type='admin')
+
+    def borrow(self):
+        self.client.force_login(self.pos)
+        self.client.post(reverse('pos_borrow_book'), {'student_id': 'CR-0001'})
+        self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn})
+        self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': ''})
+        return TransactionItem.objects.get()
+
+    def test_incremental_rollup_matches_backfill(self):
+        book, pos, admin = self.book, self.pos, self.admin
+        item = self.borrow()
+        # The shared counter rows are only updated once the loan has committed.
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('approve_transaction', args=[item.transaction_id]))
+        self.assertFalse(CirculationDaily.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.client.force_login(pos)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('pos_return_book'), {
+                'return_books': '', 'transaction_code_value': item.transaction.transaction_code,
+                'selected_books': [item.id],
+            })
+
+        expected = [(timezone.localdate(), book.id, 'Science', 'BSCS', 1, 1)]
+        fields = ('date', 'book', 'category', 'course', 'borrows', 'returns')
+        self.assertEqual(list(CirculationDaily.objects.values_list(*fields)), expected)
+        call_command('backfill_circulation', stdout=StringIO())
+        self.assertEqual(list(CirculationDaily.objects.values_list(*fields)), expected)
+
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin_analytics'), {'days': 365})
+        self.assertTrue(response.context['monthly'])
+        self.assertEqual(response.context['totals'], {'borrows': 1, 'returns': 1})
+        self.assertEqual([row['book__title'] for row in response.context['top_books']], ['Rolled Up'])
+
+    def test_second_approval_changes_nothing(self):
+        item = self.borrow()
+        self.client.force_login(self.admin)
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('approve_transaction', args=[item.transaction_id]))
+        self.assertEqual(list(CirculationDaily.objects.values_list('borrows', flat=True)), [1])
+        self.assertEqual(self.book.copies.filter(status='borrowed').count(), 1)
+
+    def test_approving_a_rejected_loan_takes_no_copy(self):
+        item = self.borrow()
+        self.client.force_login(self.admin)
+        self.client.post(reverse('reject_transaction', args=[item.transaction_id]))
+        borrows = InventoryEvent.objects.filter(kind='borrow').count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('approve_transaction', args=[item.transaction_id]))
+        item.refresh_from_db()
+        self.assertEqual(item.transaction.approval_status, 'rejected')
+        self.assertEqual(self.book.copies.filter(status='available').count(), 2)
+        self.assertEqual(InventoryEvent.objects.filter(kind='borrow').count(), borrows)
+        self.assertFalse(CirculationDaily.objects.exists())
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(isbn=f'97800000009{n:02d}', title=f'Book {n}', author='A', category='Science')
+                      for n in range(3)]
+        self.students = [Student.objects.create(student_id=f'RC-{n:04d}', last_name='Rec', first_name=str(n),
+                                                course='BSIT', year='1', section='A', is_approved=True)
+                         for n in range(3)]
+
+    def lend(self, student, *books):
+        transaction = Transaction.objects.create(transaction_code=f'REC-{Transaction.objects.count()}', student=student,
+                                                 due_date=timezone.now(), approval_status='approved',
+                                                 approved_at=timezone.now())
+        for book in books:
+            TransactionItem.objects.create(transaction=transaction, book=book)
+
+    def recommended(self, book):
+        return list(BookRecommendation.objects.filter(book=book).values_list('recommended__title', 'co_borrowers'))
+
+    def test_full_and_incremental_builds(self):
+        first, second, third = self.books
+        self.lend(self.students[0], first, second)
+        self.lend(self.students[1], first, second)
+        self.lend(self.students[2], first, third)
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        # Book 2 was borrowed with book 0 by one student only, below the minimum.
+        self.assertEqual(self.recommended(first), [('Book 1', 2)])
+        self.assertEqual(self.recommended(third), [])
+
+        self.lend(self.students[1], third)
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertCountEqual(self.recommended(first), [('Book 1', 2), ('Book 2', 2)])
+        self.assertEqual(self.recommended(third), [('Book 0', 2)])
+
+        user = User.objects.create_user('rec_student', 'pass', user_type='student')
+        self.students[2].user = user
+        self.students[2].save()
+        self.client.force_login(user)
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual([book.title for book in response.context['recommended_books']], ['Book 1'])
+
+
+    def test_incremental_update_matches_full_rebuild(self):
+        first, second, third = self.books
+        # Students with no loans keep each book's readers a minority.
+        for n in range(3, 10):
+            Student.objects.create(student_id=f'RC-{n:04d}', last_name='Rec', first_name=str(n),
+                                   course='BSIT', year='1', section='A', is_approved=True)
+        long_ago = timezone.now() - timedelta(days=90)
+        old = Transaction.objects.create(transaction_code='REC-OLD', student=self.students[0], due_date=long_ago,
+                                         return_date=long_ago, status='returned', approval_status='approved',
+                                         approved_at=long_ago)
+        TransactionItem.objects.create(transaction=old, book=third, status='returned')
+        call_command('archive_transactions', stdout=StringIO())
+        # Student 0 has read book 2 both in the archive and live; they count once.
+        self.lend(self.students[0], first, second, third)
+        self.lend(self.students[1], second, third)
+        call_command('build_recommendations', '--full', stdout=StringIO())
+
+        self.lend(self.students[2], first, second)
+        fields = ('book', 'recommended', 'co_borrowers', 'score')
+        call_command('build_recommendations', stdout=StringIO())
+        incremental = list(BookRecommendation.objects.order_by('book', 'recommended').values_list(*fields))
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        full = list(BookRecommendation.objects.order_by('book', 'recommended').values_list(*fields))
+        self.assertEqual(incremental, full)
+        self.assertIn((second.id, third.id, 2, 2 / 6 ** 0.5), full)
+        self.assertEqual(borrower_counts({first.id, third.id}), {first.id: 2, third.id: 2})
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.old, self.new, self.unread = [
+            Book.objects.create(isbn=f'97800000010{n:02d}', title=f'Popular {title}', author='A', category='Science')
+            for n, title in enumerate(['Alpha', 'Beta', 'Gamma'])
+        ]
+        today = timezone.localdate()
+        CirculationDaily.objects.create(date=today - timedelta(days=90), book=self.old, category='Science',
+                                        course='BSIT', borrows=4)
+        CirculationDaily.objects.create(date=today, book=self.new, category='Science', course='BSIT', borrows=1)
+        user = User.objects.create_user('popular_student', 'pass', user_type='student')
+        Student.objects.create(user=user, student_id='PP-0001', last_name='Pop', first_name='Ular',
+                               course='BSIT', year='1', section='A', is_approved=True)
+        self.client.force_login(user)
+
+    def titles(self, **params):
+        response = self.client.get(reverse('student_books'), params)
+        return [book.title for book in response.context['books']]
+
+    def test_decayed_scores_order_the_catalog(self):
+        self.assertEqual(self.titles(sort='popular'), ['Popular Alpha', 'Popular Beta', 'Popular Gamma'])
+        call_command('refresh_popularity', stdout=StringIO())
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        # Four borrows three half-lives ago count for half of one today.
+        self.assertEqual((self.old.popularity, self.new.popularity), (0.5, 1.0))
+        self.assertEqual(self.titles(sort='popular'), ['Popular Beta', 'Popular Alpha', 'Popular Gamma'])
+        self.assertEqual(self.titles(), ['Popular Alpha', 'Popular Beta', 'Popular Gamma'])
+        # Searches rank the text match first, then popularity.
+        self.assertEqual(self.titles(search='popular'), ['Popular Beta', 'Popular Alpha', 'Popular Gamma'])
+        self.assertEqual(self.titles(search=self.unread.isbn), ['Popular Gamma'])
+        self.assertEqual(self.titles(search='popular', sort='title'), ['Popular Alpha', 'Popular Beta', 'Popular Gamma'])
+
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(isbn='9780000001101', title='Queued', author='A', category='Science',
+                                        copies_total=1, copies_available=1)
+        self.students = []
+        for n in range(3):
+            user = User.objects.create_user(f'hold_student_{n}', 'pass', user_type='student', email=f'h{n}@example.com')
+            self.students.append(Student.objects.create(user=user, student_id=f'HQ-{n:04d}', last_name='Hold',
+                                                        first_name=str(n), course='BSIT', year='1', section='A',
+                                                        is_approved=True))
+        self.pos = User.objects.create_user('hold_pos', 'pass', user_type='pos')
+        self.admin = User.objects.create_user('hold_admin', 'pass', user_type='admin')
+
+    def borrow(self, student):
+        self.client.force_login(self.pos)
+        self.client.post(reverse('pos_borrow_book'), {'student_id': student.student_id})
+        self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn})
+        self.client.post(reverse('pos_borrow_book'), {'confirm_borrow': ''})
+        transaction = Transaction.objects.filter(student=student).latest('id')
+        self.client.force_login(self.admin)
+        self.client.post(reverse('approve_transaction', args=[transaction.id]))
+        return transaction
+
+    def return_book(self, transaction):
+        self.client.force_login(self.pos)
+        return self.client.post(reverse('pos_return_book'), {
+            'return_books': '', 'transaction_code_value': transaction.transaction_code,
+            'selected_books': list(transaction.items.values_list('id', flat=True)),
+        })
+
+    def test_returned_copy_goes_to_the_head_of_the_queue(self):
+        first, second, third = self.students
+        loan = self.borrow(first)
+        for student in (second, third):
+            self.client.force_login(student.user)
+            self.client.post(reverse('place_hold', args=[self.book.id]))
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual([hold.ahead for hold in response.context['holds']], [1])
+
+        response = self.return_book(loan)
+        copy = self.book.copies.get()
+        self.assertEqual(copy.status, 'held')
+        self.assertEqual([hold.student for hold in response.context['returned_items'][0].holds], [second])
+        self.assertEqual(list(Hold.objects.values_list('student', 'status')),
+                         [(second.id, 'ready'), (third.id, 'waiting')])
+        # The held copy is not on the shelf, for anyone but the student it was set aside for.
+        self.assertEqual(Book.objects.get(pk=self.book.pk).availability, 0)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).context['total_available'], 0)
+        self.client.force_login(self.pos)
+        self.client.post(reverse('pos_borrow_book'), {'student_id': third.student_id})
+        self.client.post(reverse('pos_borrow_book'), {'isbn': self.book.isbn})
+        self.assertEqual(self.client.session['pos_books'], [])
+
+        call_command('process_holds', stdout=StringIO())
+        self.assertEqual([message.to for message in mail.outbox], [[second.user.email]])
+        # Nobody collects it, so it passes to the next student.
+        Hold.objects.filter(student=second).update(ready_at=timezone.now() - timedelta(days=4))
+        updated_at = Book.objects.get(pk=self.book.pk).updated_at
+        call_command('process_holds', stdout=StringIO())
+        self.assertEqual(list(Hold.objects.values_list('student', 'status')),
+                         [(second.id, 'expired'), (third.id, 'ready')])
+        # No ledger event marks the hand-over, so the book itself moves the catalog version.
+        self.assertGreater(Book.objects.get(pk=self.book.pk).updated_at, updated_at)
+        self.assertEqual(mail.outbox[-1].to, [third.user.email])
+
+        self.borrow(third)
+        copy.refresh_from_db()
+        self.assertEqual(copy.status, 'borrowed')
+        self.assertEqual(Hold.objects.get(student=third).status, 'collected')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).availability, 0)
+        self.assertEqual(list(InventoryEvent.objects.values_list('kind', flat=True)), ['borrow'])
+
+    def test_ready_hold_without_a_copy_is_requeued(self):
+        first, second = self.students[:2]
+        loan = self.borrow(first)
+        self.client.force_login(second.user)
+        self.client.post(reverse('place_hold', args=[self.book.id]))
+        self.return_book(loan)
+        call_command('process_holds', stdout=StringIO())
+        self.book.copies.get().delete()
+        out = StringIO()
+        call_command('process_holds', stdout=out)
+        self.assertIn('re-queued 1 hold(s)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        hold = Hold.objects.get(student=second)
+        self.assertEqual((hold.status, hold.ready_at, hold.notified_at), ('waiting', None, None))
+
+    def test_cancelling_a_ready_hold_shelves_the_copy(self):
+        first, second = self.students[:2]
+        loan = self.borrow(first)
+        self.client.force_login(second.user)
+        self.client.post(reverse('place_hold', args=[self.book.id]))
+        self.client.post(reverse('place_hold', args=[self.book.id]))
+        self.assertEqual(Hold.objects.count(), 1)
+        self.return_book(loan)
+
+        self.client.force_login(second.user)
+        self.client.post(reverse('cancel_hold', args=[Hold.objects.get().id]))
+        self.assertEqual(self.book.copies.get().status, 'available')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).availability, 1)
+
+
+class PosApiTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(isbn='9780000001201', title='Terminal', author='A', category='Science',
+                                        copies_total=2, copies_available=2)
+        Student.objects.create(student_id='PA-0001', last_name='Api', first_name='Student',
+                               course='BSIT', year='1', section='A', is_approved=True)
+        User.objects.create_user('api_pos', 'pass', user_type='pos')
+        out = StringIO()
+        call_command('issue_pos_token', 'api_pos', '--name', 'Desk 1', stdout=out)
+        self.auth = {'HTTP_AUTHORIZATION': 'Token ' + out.getvalue().split(': ')[1].split()[0]}
+
+    def post(self, url_name, payload):
+        return self.client.post(reverse(url_name), payload, content_type='application/json', **self.auth)
+
+    def test_lookup_checkout_and_return(self):
+        self.assertEqual(self.client.get(reverse('api_pos_student', args=['PA-0001'])).status_code, 401)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_pos_student', args=['PA-0001']), **self.auth)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.json()['student']['last_name'], 'Api')
+        self.assertEqual(self.client.get(reverse('api_pos_student', args=['PA-9999']), **self.auth).status_code, 404)
+        book = self.client.get(reverse('api_pos_book', args=[self.book.isbn]), **self.auth).json()
+        self.assertEqual((book['book']['title'], book['book']['available'], book['copy']), ('Terminal', 2, None))
+
+        payload = {'student_id': 'PA-0001', 'codes': [self.book.isbn, self.book.isbn, '9789999999999'],
+                   'idempotency_key': 'desk-1-0001'}
+        response = self.post('api_pos_checkout', payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([entry['status'] for entry in response.json()['scanned']], ['added', 'added', 'not_found'])
+        retry = self.post('api_pos_checkout', payload)
+        self.assertEqual((retry.status_code, retry.json()['created']), (200, False))
+        self.assertEqual(retry.json()['transaction']['code'], response.json()['transaction']['code'])
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(self.post('api_pos_checkout', {**payload, 'idempotency_key': 'desk-1-0002'}).status_code, 409)
+
+        loan = Transaction.objects.get()
+        loan.approval_status = 'approved'
+        loan.save()
+        BookCopy.objects.filter(current_item__transaction=loan).update(status='borrowed')
+        barcodes = [item['barcode'] for item in response.json()['transaction']['items']]
+        response = self.post('api_pos_returns', {'barcodes': barcodes[:1] + ['C9999999-001']})
+        self.assertEqual([item['barcode'] for item in response.json()['returned']], barcodes[:1])
+        self.assertEqual(response.json()['not_on_loan'], ['C9999999-001'])
+        self.post('api_pos_returns', {'barcodes': barcodes[1:]})
+        loan.refresh_from_db()
+        self.assertEqual(loan.status, 'returned')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).availability, 2)
+
+    def test_idempotency_keys_are_per_account(self):
+        other = PosToken.issue(User.objects.create_user('api_pos_2', 'pass', user_type='pos'), 'Desk 2')
+        payload = {'student_id': 'PA-0001', 'codes': [self.book.isbn], 'idempotency_key': '0001'}
+        first = self.post('api_pos_checkout', payload)
+        second = self.client.post(reverse('api_pos_checkout'), payload, content_type='application/json',
+                                  HTTP_AUTHORIZATION='Token ' + other)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertNotEqual(first.json()['transaction']['code'], second.json()['transaction']['code'])
+        self.assertEqual(self.post('api_pos_checkout', payload).json()['transaction']['code'],
+                         first.json()['transaction']['code'])
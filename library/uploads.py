@@ -0,0 +1,142 @@
+"""
+Upload-time image normalization.
+
+Forms reject images whose pixel count exceeds UPLOAD_IMAGE_MAX_PIXELS before
+anything is decoded. Accepted uploads are saved as-is so the POST returns
+immediately; once the row is committed a worker re-encodes the file without
+EXIF, no larger than UPLOAD_IMAGE_MAX_DIMENSION on either side, swaps the
+stored name over and generates its renditions.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import renditions
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'UPLOAD_IMAGE_WORKERS', 2), thread_name_prefix='image-upload'
+)
+
+
+def max_pixels():
+    return getattr(settings, 'UPLOAD_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def validate_image_upload(upload):
+    """Form-level check; forms.ImageField has already parsed the header into upload.image."""
+    image = getattr(upload, 'image', None)
+    if image is not None and image.width * image.height > max_pixels():
+        raise ValidationError(
+            f'Image is too large ({image.width}x{image.height}). '
+            f'Please upload an image under {max_pixels() // 1_000_000} megapixels.'
+        )
+    return upload
+
+
+def encode(data):
+    """Return (bytes, extension) for the normalized image, or None if `data` is already fine."""
+    image = Image.open(BytesIO(data))
+    if image.width * image.height > max_pixels():
+        raise Image.DecompressionBombError(f'{image.width}x{image.height} exceeds UPLOAD_IMAGE_MAX_PIXELS')
+    image.load()
+    has_exif = bool(image.getexif())
+    image = ImageOps.exif_transpose(image)
+
+    limit = getattr(settings, 'UPLOAD_IMAGE_MAX_DIMENSION', 1600)
+    resized = max(image.size) > limit
+    image.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image.convert('RGBA').save(buffer, 'PNG', optimize=True)
+        ext = 'png'
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=getattr(settings, 'UPLOAD_IMAGE_QUALITY', 85),
+                                  optimize=True, progressive=True)
+        ext = 'jpg'
+
+    if not resized and not has_exif and buffer.tell() >= len(data):
+        return None
+    return buffer.getvalue(), ext
+
+
+def auto_now_values(model):
+    """queryset.update() skips auto_now fields; pass these along so e.g. Book.updated_at still moves."""
+    return {field.name: timezone.now() for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+
+
+def _delete_if_unused(model, field_name, name):
+    # Identical uploads share one content-addressed file, so other rows may
+    # still point at it.
+    if not model._default_manager.filter(**{field_name: name}).exists():
+        model._meta.get_field(field_name).storage.delete(name)
+
+
+def normalize(model, pk, field_name, name):
+    """Re-encode the stored file `name` and point the row at the result."""
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+
+    try:
+        result = encode(data)
+    except Image.DecompressionBombError:
+        # Only reachable for uploads that bypassed form validation.
+        logger.warning('Removing oversized upload %s', name)
+        model._default_manager.filter(pk=pk, **{field_name: name}).update(
+            **{field_name: ''}, **auto_now_values(model)
+        )
+        _delete_if_unused(model, field_name, name)
+        return
+
+    if result is not None:
+        content, ext = result
+        new_name = storage.save(f'{os.path.splitext(name)[0]}.{ext}', ContentFile(content))
+        # Leave the row alone if another upload replaced this one in the meantime.
+        updated = model._default_manager.filter(pk=pk, **{field_name: name}).update(
+            **{field_name: new_name}, **auto_now_values(model)
+        )
+        if not updated:
+            _delete_if_unused(model, field_name, new_name)
+            return
+        _delete_if_unused(model, field_name, name)
+        name = new_name
+
+    renditions.ensure(field.attr_class(None, field, name))
+
+
+def _normalize_logged(model, pk, field_name, name):
+    try:
+        normalize(model, pk, field_name, name)
+    except (OSError, UnidentifiedImageError, ValueError):
+        logger.warning('Could not normalize upload %s', name, exc_info=True)
+    except Exception:
+        logger.exception('Could not normalize upload %s', name)
+
+
+def _normalize_in_background(*args):
+    try:
+        _normalize_logged(*args)
+    finally:
+        connection.close()
+
+
+def submit(instance, field_name):
+    """Queue the file just saved in `instance.<field_name>` for normalization."""
+    args = (type(instance), instance.pk, field_name, getattr(instance, field_name).name)
+    if not getattr(settings, 'UPLOAD_IMAGE_ASYNC', True):
+        _normalize_logged(*args)
+        return
+    _executor.submit(_normalize_in_background, *args)
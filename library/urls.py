@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.user_login, name='login'),
@@ -12,6 +12,8 @@ urlpatterns = [
     path('student/dashboard/', views.student_dashboard, name='student_dashboard'),
     path('student/books/', views.student_books, name='student_books'),
     path('student/settings/', views.student_settings, name='student_settings'),
+    path('student/holds/place/<int:book_id>/', views.place_hold, name='place_hold'),
+    path('student/holds/cancel/<int:hold_id>/', views.cancel_hold, name='cancel_hold'),
     
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('admin/import-students/', views.import_students_csv, name='import_students_csv'),
@@ -40,11 +42,23 @@ urlpatterns = [
     path('admin/transactions/reject/<int:transaction_id>/', views.reject_transaction, name='reject_transaction'),
     path('admin/create-pos/', views.create_pos_account, name='create_pos_account'),
     path('admin/settings/', views.admin_settings, name='admin_settings'),
+    path('admin/metrics/', views.admin_metrics, name='admin_metrics'),
+    path('admin/analytics/', views.admin_analytics, name='admin_analytics'),
+    path('admin/slow-queries/', views.admin_slow_queries, name='admin_slow_queries'),
+    path('admin/profiles/', views.admin_profiles, name='admin_profiles'),
+    path('admin/profiles/<int:capture_id>/', views.admin_profile_detail, name='admin_profile_detail'),
+    path('admin/profiles/<int:capture_id>/download/', views.admin_profile_download, name='admin_profile_download'),
+    path('metrics', views.metrics_export, name='metrics_export'),
     
     path('librarian/dashboard/', views.librarian_dashboard, name='librarian_dashboard'),
     
     path('pos/home/', views.pos_home, name='pos_home'),
     path('pos/borrow/', views.pos_borrow_book, name='pos_borrow_book'),
     path('pos/return/', views.pos_return_book, name='pos_return_book'),
+    
+    path('api/pos/students/<str:student_id>/', api.student, name='api_pos_student'),
+    path('api/pos/books/<str:code>/', api.book, name='api_pos_book'),
+    path('api/pos/checkouts/', api.checkout, name='api_pos_checkout'),
+    path('api/pos/returns/', api.returns, name='api_pos_returns'),
 ]
 
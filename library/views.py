@@ -7,15 +7,17 @@ from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q
 from django.db import transaction
-from datetime import timedelta
+from django.views.decorators.cache import cache_control
 import csv
 from io import TextIOWrapper
 
-from .models import User, Student, Book, Transaction, VerificationCode, TransactionItem, Librarian, SystemSettings, AdminLog
+from .models import User, Student, Book, BookCopy, Category, CirculationDaily, Hold, InventoryEvent, Transaction, VerificationCode, TransactionItem, Librarian, SystemSettings, AdminLog, SlowQuery, ProfileCapture
 from .forms import (LoginForm, StudentIDVerificationForm, StudentRegistrationForm,
                    EmailVerificationForm, CSVUploadForm, BookForm, POSUserForm,
                    StudentSearchForm, ISBNSearchForm, TransactionCodeForm, StudentForm,
                    LibrarianForm, SystemSettingsForm)
+from .catalog import catalog_condition
+from .isbn import canonical_isbn
 
 
 def user_login(request):
@@ -175,10 +177,11 @@ def student_dashboard(request):
         approval_status='approved'
     ).prefetch_related('items__book')
     
-    history = Transaction.objects.filter(
-        student=student,
-        approval_status='approved'
-    ).prefetch_related('items__book').order_by('-borrowed_date')[:10]
+    from .archive import student_history
+    from .recommendations import for_student
+    history = student_history(student)
+    borrowed_book_ids = {item.book_id for entry in history for item in entry.items.all()}
+    recommended_books = for_student(borrowed_book_ids) if borrowed_book_ids else []
     
     search_query = request.GET.get('search', '')
     category = request.GET.get('category', '')
@@ -193,13 +196,23 @@ def student_dashboard(request):
     if category:
         books = books.filter(category=category)
     
-    categories = Book.objects.order_by('category').values_list('category', flat=True).distinct()
+    categories = Category.objects.filter(book_count__gt=0).values_list('name', flat=True)
     
     returned_count = Transaction.objects.filter(
         student=student,
         status='returned',
         approval_status='approved'
-    ).count()
+    ).count() + student.archived_transactions.filter(status='returned', approval_status='approved').count()
+    
+    from django.db.models import Count, OuterRef, Subquery
+    ahead = (
+        Hold.objects.filter(book=OuterRef('book'), status='waiting', created_at__lt=OuterRef('created_at'))
+        .order_by().values('book').annotate(count=Count('id')).values('count')
+    )
+    holds = (
+        student.holds.filter(status__in=Hold.OPEN_STATUSES).select_related('book', 'copy')
+        .annotate(ahead=Subquery(ahead))
+    )
     
     context = {
         'student': student,
@@ -210,6 +223,8 @@ def student_dashboard(request):
         'search_query': search_query,
         'selected_category': category,
         'returned_count': returned_count,
+        'recommended_books': recommended_books,
+        'holds': holds,
     }
     
     return render(request, 'library/student_dashboard.html', context)
@@ -221,16 +236,15 @@ def admin_dashboard(request):
         return redirect('dashboard')
     
     from .models import TransactionItem
-    from django.db.models import Sum
     
     total_students = Student.objects.count()
     
-    total_book_copies = Book.objects.aggregate(total=Sum('copies_total'))['total'] or 0
     total_borrowed = TransactionItem.objects.filter(
         status='borrowed',
         transaction__approval_status='approved'
     ).count()
-    total_available = total_book_copies - total_borrowed
+    # Copies pending approval, on the hold shelf or withdrawn are not on the shelf either.
+    total_available = BookCopy.objects.filter(status='available').count()
     
     total_books = Book.objects.count()
     pending_registrations = Student.objects.filter(
@@ -331,8 +345,9 @@ def import_books_csv(request):
                                 continue
                         
                         book, created = Book.objects.get_or_create(
-                            isbn=isbn,
+                            isbn13=canonical_isbn(isbn),
                             defaults={
+                                'isbn': isbn,
                                 'title': title,
                                 'author': author,
                                 'category': category,
@@ -485,20 +500,23 @@ def import_students_csv(request):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@catalog_condition('admin', 'librarian')
 def manage_books(request):
     if request.user.user_type not in ['admin', 'librarian']:
         return redirect('dashboard')
     
     from django.core.paginator import Paginator
     
-    books = Book.objects.all().order_by('title')
+    books = Book.objects.with_availability().order_by('title')
     search_query = request.GET.get('search', '')
     
     if search_query:
         books = books.filter(
             Q(title__icontains=search_query) |
             Q(author__icontains=search_query) |
-            Q(isbn__icontains=search_query)
+            Q(isbn__icontains=search_query) |
+            Q(isbn13=canonical_isbn(search_query))
         )
     
     paginator = Paginator(books, 20)
@@ -508,7 +526,8 @@ def manage_books(request):
     return render(request, 'library/manage_books.html', {
         'books': page_obj,
         'page_obj': page_obj,
-        'search_query': search_query
+        'search_query': search_query,
+        'categories': Category.objects.filter(book_count__gt=0)
     })
 
 
@@ -559,7 +578,7 @@ def manage_students(request):
     
     pending_students = Student.objects.filter(user__isnull=False, is_approved=False).order_by('-created_at')
     
-    students = Student.objects.all().order_by('last_name')
+    students = Student.objects.select_related('user').order_by('last_name')
     search_query = request.GET.get('search', '')
     
     if search_query:
@@ -586,7 +605,7 @@ def pending_students(request):
     if request.user.user_type not in ['admin', 'librarian']:
         return redirect('dashboard')
     
-    pending = Student.objects.filter(user__isnull=False, is_approved=False).order_by('-created_at')
+    pending = Student.objects.filter(user__isnull=False, is_approved=False).select_related('user').order_by('-created_at')
     
     return render(request, 'library/pending_students.html', {
         'pending_students': pending
@@ -685,48 +704,74 @@ def pos_borrow_book(request):
                 messages.error(request, 'Student ID not found or not approved by admin')
         
         elif 'isbn' in request.POST:
-            isbn = request.POST.get('isbn')
             student_id = request.session.get('pos_student_id')
             
             if not student_id:
                 return redirect('pos_borrow_book')
             
-            try:
-                book = Book.objects.get(isbn=isbn)
-                if not book.is_available():
-                    messages.error(request, 'Book is not available')
+            from .circulation import scan
+            
+            # A scanner burst or pasted list arrives as several codes in one request.
+            codes = request.POST.get('isbn').replace(',', ' ').split()
+            books = request.session.get('pos_books', [])
+            scan_results = scan(codes, student_id, [book_data.get('copy_id') for book_data in books])
+            for result in scan_results:
+                book, copy = result['book'], result['copy']
+                # Errors for a batch name the code they are about.
+                prefix = f"{result['code']}: " if len(codes) > 1 else ''
+                if result['status'] == 'not_found':
+                    messages.error(request, f'{prefix}Book with this ISBN not found')
+                elif result['status'] == 'unavailable':
+                    if result['expected_back']:
+                        expected = timezone.localtime(result['expected_back']).strftime('%b %d, %Y')
+                        messages.error(request, f'{prefix}Book is not available (next copy expected back {expected})')
+                    else:
+                        messages.error(request, f'{prefix}Book is not available')
                 else:
-                    books = request.session.get('pos_books', [])
                     books.append({
                         'id': book.id,
+                        'copy_id': copy.id,
+                        'barcode': copy.barcode,
                         'isbn': book.isbn,
                         'title': book.title,
                         'author': book.author
                     })
-                    request.session['pos_books'] = books
-                    student = Student.objects.get(student_id=student_id)
-                    
-                    if 'add_another' in request.POST:
-                        return render(request, 'library/pos_borrow_book.html', {
-                            'student': student,
-                            'books': books,
-                            'step': 'add_books'
-                        })
-                    else:
-                        return render(request, 'library/pos_borrow_book.html', {
-                            'student': student,
-                            'books': books,
-                            'step': 'confirm'
-                        })
-            except Book.DoesNotExist:
-                messages.error(request, 'Book with this ISBN not found')
-                student = Student.objects.get(student_id=student_id)
+            request.session['pos_books'] = books
+            student = Student.objects.get(student_id=student_id)
+            
+            # Stay on the scan step to add more, or to show what could not be added.
+            failed = any(result['status'] != 'added' for result in scan_results)
+            if 'add_another' in request.POST or failed or not books:
                 return render(request, 'library/pos_borrow_book.html', {
                     'student': student,
+                    'books': books,
+                    'scan_results': scan_results,
                     'step': 'add_books'
                 })
+            else:
+                from uuid import uuid4
+                return render(request, 'library/pos_borrow_book.html', {
+                    'student': student,
+                    'books': books,
+                    'scan_results': scan_results,
+                    'step': 'confirm',
+                    'idempotency_key': uuid4().hex
+                })
         
         elif 'confirm_borrow' in request.POST:
+            from .circulation import checkout, submitted_checkout
+            
+            # A double click or client retry resubmits the same key and gets
+            # the transaction the first submission created.
+            idempotency_key = request.POST.get('idempotency_key') or None
+            original = submitted_checkout(idempotency_key, request.user)
+            if original:
+                messages.info(request, f'Checkout {original.transaction_code} was already recorded')
+                return render(request, 'library/pos_borrow_success.html', {
+                    'student': original.student,
+                    'transaction': original
+                })
+            
             student_id = request.session.get('pos_student_id')
             books_data = request.session.get('pos_books', [])
             
@@ -734,32 +779,17 @@ def pos_borrow_book(request):
                 return redirect('pos_borrow_book')
             
             student = Student.objects.get(student_id=student_id)
+            copy_ids = [book_data.get('copy_id') for book_data in books_data]
+            transaction, created = checkout(student, copy_ids, request.user, idempotency_key)
+            if not created:
+                # A concurrent retry with the same key got there first.
+                messages.info(request, f'Checkout {transaction.transaction_code} was already recorded')
             
-            transaction_code = Transaction.generate_transaction_code()
-            due_date = timezone.now() + timedelta(days=7)
-            
-            transaction = Transaction.objects.create(
-                transaction_code=transaction_code,
-                student=student,
-                due_date=due_date,
-                created_by=request.user
-            )
-            
-            from .models import TransactionItem
-            for book_data in books_data:
-                book = Book.objects.get(id=book_data['id'])
-                
-                if book.is_available():
-                    TransactionItem.objects.create(
-                        transaction=transaction,
-                        book=book
-                    )
-            
-            del request.session['pos_student_id']
-            del request.session['pos_books']
+            request.session.pop('pos_student_id', None)
+            request.session.pop('pos_books', None)
             
             return render(request, 'library/pos_borrow_success.html', {
-                'student': student,
+                'student': transaction.student,
                 'transaction': transaction
             })
     
@@ -773,7 +803,13 @@ def pos_return_book(request):
     
     if request.method == 'POST':
         if 'transaction_code' in request.POST:
-            transaction_code = request.POST.get('transaction_code')
+            transaction_code = request.POST.get('transaction_code').strip()
+            # A scanned copy barcode finds its open loan and preselects just that book.
+            scanned_item = TransactionItem.objects.filter(
+                current_copy__barcode=transaction_code, status='borrowed'
+            ).select_related('transaction').first()
+            if scanned_item:
+                transaction_code = scanned_item.transaction.transaction_code
             transaction = Transaction.objects.filter(
                 transaction_code__startswith=transaction_code,
                 approval_status='approved'
@@ -785,6 +821,7 @@ def pos_return_book(request):
                     return render(request, 'library/pos_return_book.html', {
                         'transaction': transaction,
                         'borrowed_items': borrowed_items,
+                        'scanned_item': scanned_item,
                         'step': 'confirm'
                     })
                 else:
@@ -797,33 +834,14 @@ def pos_return_book(request):
             selected_items = request.POST.getlist('selected_books')
             
             if transaction_code and selected_items:
-                from .models import TransactionItem
                 transaction = Transaction.objects.filter(
                     transaction_code=transaction_code,
                     approval_status='approved'
-                ).prefetch_related('items__book').first()
+                ).select_related('student').prefetch_related('items__book').first()
                 
                 if transaction:
-                    returned_items = []
-                    unreturned_items = []
-                    
-                    for item in transaction.items.filter(status='borrowed'):
-                        if str(item.id) in selected_items:
-                            item.status = 'returned'
-                            item.return_date = timezone.now()
-                            item.save()
-                            
-                            item.book.copies_available += 1
-                            item.book.save()
-                            returned_items.append(item)
-                        else:
-                            unreturned_items.append(item)
-                    
-                    all_returned = not transaction.items.filter(status='borrowed').exists()
-                    if all_returned:
-                        transaction.status = 'returned'
-                        transaction.return_date = timezone.now()
-                        transaction.save()
+                    from .circulation import return_items
+                    returned_items, unreturned_items, all_returned = return_items(transaction, selected_items, request.user)
                     
                     return render(request, 'library/pos_return_success.html', {
                         'student': transaction.student,
@@ -857,19 +875,35 @@ def approve_transaction(request, transaction_id):
         return redirect('dashboard')
     
     if request.method == 'POST':
-        transaction = Transaction.objects.get(id=transaction_id)
-        
-        for item in transaction.items.all():
-            item.book.copies_available -= 1
-            item.book.save()
-        
-        transaction.approval_status = 'approved'
-        transaction.approved_by = request.user
-        transaction.approved_at = timezone.now()
-        transaction.save()
+        with transaction.atomic():
+            # A repeated or late approval must not lend copies or count borrows again.
+            loan = Transaction.objects.select_for_update().select_related('student').get(id=transaction_id)
+            if loan.approval_status != 'pending':
+                messages.warning(request, f'Transaction {loan.transaction_code} has already been {loan.approval_status}')
+                return redirect('pending_transactions')
+            
+            for item in loan.items.select_related('book'):
+                held = BookCopy.objects.filter(current_item=item).update(status='borrowed')
+                if not held:
+                    # Loans recorded before copies existed take any copy on the shelf.
+                    copy = item.book.copies.filter(status='available').order_by('number').first()
+                    if copy:
+                        copy.status = 'borrowed'
+                        copy.current_item = item
+                        copy.save(update_fields=['status', 'current_item'])
+                        item.copy = copy
+                        item.save(update_fields=['copy'])
+                        InventoryEvent.record([copy], 'borrow', request.user)
+                        Book.lent([item.book_id], loan.due_date)
+                CirculationDaily.add(item.borrowed_date, item.book, loan.student.course, borrows=1)
+            
+            loan.approval_status = 'approved'
+            loan.approved_by = request.user
+            loan.approved_at = timezone.now()
+            loan.save()
         
-        book_count = transaction.items.count()
-        messages.success(request, f'{book_count} book(s) borrowing approved for {transaction.student.get_full_name()}')
+        book_count = loan.items.count()
+        messages.success(request, f'{book_count} book(s) borrowing approved for {loan.student.get_full_name()}')
     
     return redirect('pending_transactions')
 
@@ -882,6 +916,9 @@ def reject_transaction(request, transaction_id):
     if request.method == 'POST':
         transaction = Transaction.objects.get(id=transaction_id)
         
+        for item in transaction.items.all():
+            BookCopy.release(item, request.user)
+        
         transaction.approval_status = 'rejected'
         transaction.approved_by = request.user
         transaction.approved_at = timezone.now()
@@ -1064,7 +1101,7 @@ def student_books(request):
     if category:
         books = books.filter(category=category)
     
-    categories = Book.objects.order_by('category').values_list('category', flat=True).distinct()
+    categories = Category.objects.filter(book_count__gt=0).values_list('name', flat=True)
     
     paginator = Paginator(books, 12)
     page_number = request.GET.get('page')
@@ -1096,11 +1133,12 @@ def export_books_by_category(request):
     
     response = HttpResponse(content_type='text/csv')
     if category:
-        response['Content-Disposition'] = f'attachment; filename="books_{category}.csv"'
-        books = Book.objects.filter(category=category)
+        category = get_object_or_404(Category, name=category)
+        response['Content-Disposition'] = f'attachment; filename="books_{category.name}.csv"'
+        books = Book.objects.with_availability().filter(category=category.name)
     else:
         response['Content-Disposition'] = 'attachment; filename="all_books.csv"'
-        books = Book.objects.all()
+        books = Book.objects.with_availability().order_by('category', 'title')
     
     writer = csv.writer(response)
     writer.writerow(['ISBN', 'Title', 'Author', 'Category', 'Publisher', 'Year', 'Copies Total', 'Copies Available'])
@@ -1114,7 +1152,7 @@ def export_books_by_category(request):
             book.publisher or '',
             book.year_published or '',
             book.copies_total,
-            book.copies_available
+            book.availability
         ])
     
     return response
@@ -1126,16 +1164,15 @@ def librarian_dashboard(request):
         return redirect('dashboard')
     
     from .models import TransactionItem
-    from django.db.models import Sum
     
     total_students = Student.objects.count()
     
-    total_book_copies = Book.objects.aggregate(total=Sum('copies_total'))['total'] or 0
     total_borrowed = TransactionItem.objects.filter(
         status='borrowed',
         transaction__approval_status='approved'
     ).count()
-    total_available = total_book_copies - total_borrowed
+    # Copies pending approval, on the hold shelf or withdrawn are not on the shelf either.
+    total_available = BookCopy.objects.filter(status='available').count()
     
     total_books = Book.objects.count()
     pending_registrations = Student.objects.filter(
@@ -1283,32 +1320,21 @@ def admin_logs(request):
     return render(request, 'library/admin_logs.html', context)
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@catalog_condition('student')
 def student_books(request):
     if request.user.user_type != 'student':
         return redirect('dashboard')
     
-    from django.core.paginator import Paginator
+    from .catalog import SORTS, catalog_page
     
     search_query = request.GET.get('search', '')
     selected_category = request.GET.get('category', '')
+    sort = request.GET.get('sort', '')
+    if sort not in SORTS:
+        sort = ''
     
-    books = Book.objects.filter(copies_total__gt=0).order_by('title')
-    
-    if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(isbn__icontains=search_query)
-        )
-    
-    if selected_category:
-        books = books.filter(category=selected_category)
-    
-    categories = Book.objects.order_by('category').values_list('category', flat=True).distinct()
-    
-    paginator = Paginator(books, 24)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj, categories = catalog_page(search_query, selected_category, request.GET.get('page'), sort)
     
     context = {
         'books': page_obj,
@@ -1316,11 +1342,207 @@ def student_books(request):
         'categories': categories,
         'search_query': search_query,
         'selected_category': selected_category,
+        'sort': sort,
+        'sorts': SORTS.items(),
     }
     
     return render(request, 'library/student_books.html', context)
 
 
+@login_required
+def place_hold(request, book_id):
+    if request.user.user_type != 'student':
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        from django.db import IntegrityError
+        
+        student = Student.objects.get(user=request.user)
+        book = get_object_or_404(Book, id=book_id, copies_total__gt=0)
+        if book.is_available():
+            messages.info(request, f'"{book.title}" is on the shelf; borrow it at the counter.')
+        elif student.holds.filter(book=book, status__in=Hold.OPEN_STATUSES).exists():
+            messages.info(request, f'You are already in the queue for "{book.title}".')
+        else:
+            try:
+                Hold.objects.create(book=book, student=student)
+                messages.success(request, f'You are in the queue for "{book.title}". We will email you when a copy is set aside.')
+            except IntegrityError:
+                messages.info(request, f'You are already in the queue for "{book.title}".')
+    
+    return redirect('student_dashboard')
+
+
+@login_required
+def cancel_hold(request, hold_id):
+    if request.user.user_type != 'student':
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        hold = get_object_or_404(Hold, id=hold_id, student__user=request.user)
+        if Hold.close([hold.id], 'cancelled'):
+            messages.success(request, f'Your hold on "{hold.book.title}" has been cancelled.')
+    
+    return redirect('student_dashboard')
+
+
+@login_required
+def admin_metrics(request):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from .metrics import COUNTERS, registry
+    
+    if request.method == 'POST' and 'reset_metrics' in request.POST:
+        registry.reset()
+        messages.success(request, 'Request metrics have been reset.')
+        return redirect('admin_metrics')
+    
+    values = registry.counters()
+    catalog_lookups = values['catalog_cache_hits'] + values['catalog_cache_misses']
+    
+    return render(request, 'library/admin_metrics.html', {
+        'rows': registry.snapshot(),
+        'counters': [{'name': name, 'help': help_text, 'value': values[name]} for name, help_text in COUNTERS.items()],
+        'catalog_hit_rate': values['catalog_cache_hits'] * 100 / catalog_lookups if catalog_lookups else None,
+        'metrics_enabled': settings.REQUEST_METRICS_ENABLED
+    })
+
+
+@login_required
+def admin_analytics(request):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from .analytics import report
+    
+    ranges = [(7, 'Last 7 days'), (30, 'Last 30 days'), (90, 'Last 90 days'), (365, 'Last year'), (1825, 'Last 5 years')]
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in dict(ranges):
+        days = 30
+    category = request.GET.get('category', '')
+    
+    return render(request, 'library/admin_analytics.html', {
+        **report(days, category),
+        'ranges': ranges,
+        'days': days,
+        'selected_category': category,
+        'categories': Category.objects.filter(book_count__gt=0).values_list('name', flat=True),
+    })
+
+
+@login_required
+def admin_slow_queries(request):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from django.core.paginator import Paginator
+    from django.db.models import Avg, Count, Max, Sum
+    
+    table_filter = request.GET.get('table', '')
+    fingerprint_filter = request.GET.get('fingerprint', '')
+    
+    slow_queries = SlowQuery.objects.all()
+    if table_filter:
+        slow_queries = slow_queries.filter(table_name=table_filter)
+    
+    fingerprints = slow_queries.values('fingerprint', 'table_name', 'normalized_sql').annotate(
+        count=Count('id'),
+        total_ms=Sum('duration_ms'),
+        avg_ms=Avg('duration_ms'),
+        max_ms=Max('duration_ms')
+    ).order_by('-total_ms')[:25]
+    
+    if fingerprint_filter:
+        slow_queries = slow_queries.filter(fingerprint=fingerprint_filter)
+    
+    tables = SlowQuery.objects.order_by('table_name').values_list('table_name', flat=True).distinct()
+    
+    paginator = Paginator(slow_queries, 50)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+    
+    return render(request, 'library/admin_slow_queries.html', {
+        'fingerprints': fingerprints,
+        'slow_queries': page_obj,
+        'page_obj': page_obj,
+        'tables': tables,
+        'selected_table': table_filter,
+        'selected_fingerprint': fingerprint_filter,
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS
+    })
+
+
+@login_required
+def admin_profiles(request):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from .profiling import make_token
+    
+    token = None
+    if request.method == 'POST' and 'generate_token' in request.POST:
+        token = make_token(request.user)
+    
+    captures = ProfileCapture.objects.select_related('issued_by', 'requested_by').defer('stats')
+    
+    return render(request, 'library/admin_profiles.html', {
+        'captures': captures,
+        'token': token,
+        'param': settings.PROFILE_QUERY_PARAM,
+        'token_max_age_minutes': settings.PROFILE_TOKEN_MAX_AGE // 60
+    })
+
+
+@login_required
+def admin_profile_detail(request, capture_id):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from .profiling import SORT_KEYS, stats_rows
+    
+    capture = get_object_or_404(ProfileCapture, id=capture_id)
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        sort = 'cumulative'
+    
+    return render(request, 'library/admin_profile_detail.html', {
+        'capture': capture,
+        'rows': stats_rows(bytes(capture.stats), sort),
+        'sort': sort
+    })
+
+
+@login_required
+def admin_profile_download(request, capture_id):
+    if request.user.user_type != 'admin':
+        return redirect('dashboard')
+    
+    from django.http import HttpResponse
+    
+    capture = get_object_or_404(ProfileCapture, id=capture_id)
+    response = HttpResponse(bytes(capture.stats), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="profile_{capture.id}.prof"'
+    return response
+
+
+def metrics_export(request):
+    from django.http import HttpResponse
+    from django.utils.crypto import constant_time_compare
+    from .metrics import registry
+    
+    is_admin = request.user.is_authenticated and request.user.user_type == 'admin'
+    token = settings.METRICS_TOKEN
+    has_token = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (is_admin or has_token):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    
+    return HttpResponse(registry.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def download_books_csv_template(request):
     if request.user.user_type not in ['admin', 'librarian']: